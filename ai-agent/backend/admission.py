@@ -0,0 +1,79 @@
+# admission.py - Pool de threads dimensionado para a inferência, com controle de admissão
+# Os handlers async despacham o trabalho de CPU (spaCy/NumPy/MLP) para cá em vez do
+# threadpool padrão do Starlette. Com o pool e a fila cheios a requisição é recusada
+# na hora (503), e cada tarefa tem um prazo: se ele vence na fila, o trabalho nem começa.
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class Overloaded(Exception):
+    pass
+
+class DeadlineExceeded(Exception):
+    pass
+
+class BoundedExecutor:
+    def __init__(self, max_workers=4, max_queue=64):
+        """
+        max_workers: threads de inferência
+        max_queue: tarefas aguardando além das que estão rodando; acima disso, Overloaded
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self.in_flight = 0
+        self.rejected = 0
+        self.expired = 0
+
+    def _get_pool(self):
+        # criado sob demanda e recriado após fork (ex.: gunicorn --preload), pois threads não sobrevivem ao fork
+        if self._pid != os.getpid():
+            self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='inference')
+            self._pid = os.getpid()
+            self.in_flight = 0
+        return self._pool
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _run_before(self, deadline, fn, args):
+        if time.monotonic() > deadline:
+            with self._lock:
+                self.expired += 1
+            raise DeadlineExceeded()
+        return fn(*args)
+
+    async def run(self, fn, *args, timeout=10.0):
+        """
+        Executa fn(*args) no pool e aguarda no máximo `timeout` segundos.
+        Levanta Overloaded se não houver vaga e DeadlineExceeded se o prazo vencer.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            pool = self._get_pool()
+            if self.in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise Overloaded()
+            self.in_flight += 1
+        future = pool.submit(self._run_before, deadline, fn, args)
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            # ainda na fila: é descartada; já rodando: termina em segundo plano e o resultado é ignorado
+            future.cancel()
+            raise DeadlineExceeded()
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "expired": self.expired,
+        }
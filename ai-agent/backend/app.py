@@ -1,86 +1,429 @@
 # app.py (Atualizado para integrar o modelo MLP, Word2Vec e fallback com BM25/TF-IDF)
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
-import uvicorn, os, json
+import uvicorn, os, json, logging, time, hmac, itertools, asyncio
 import numpy as np
-import nltk
-import spacy
-from gensim.models import Word2Vec
-from sklearn.neural_network import MLPClassifier
-from sklearn.preprocessing import LabelEncoder, StandardScaler
-from bm25 import BM25
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from functools import lru_cache
+from index_bundle import IndexBundle, INDEX_BUNDLE_DIR, KB_FILE, MODEL_FILE, W2V_VECTORS_FILE, GUIDE_FILE, STOPWORDS_LANGUAGE, phase
+from cache import ResponseCache, normalize_question
+from lemmatizer import FastPreprocessor, SPACY_MODEL, load_spacy, spacy_preprocess_batch as _spacy_preprocess_batch
+from batching import MicroBatcher
+from admission import BoundedExecutor, Overloaded, DeadlineExceeded
+from retrieval import HybridRetriever, BM25Ranker, TfidfRanker, DenseIndex, DenseRanker, IVFIndex
+from kb_index import KBIndex
+from kb_store import static_result, encode_response, encode_responses
+from kb_registry import KBRegistry, KB_REGISTRY_FILE, load_registry, directory_bytes
+from keyword_router import KeywordRouter
+from spelling import SpellCorrector, term_frequencies
+from suggest import Suggester, SUGGEST_TOP_K, MIN_QUERY_COUNT
+from metrics import Registry, TimedRanker, process_rss_bytes
+from profiler import SamplingProfiler
+from tuning import load_tuning, TUNING_FILE
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response
 
-# Baixar recursos NLTK
-nltk.download('stopwords', quiet=True)
-nltk.download('punkt', quiet=True)
-
-# Configurações
-MODEL_FILE = 'mlp_intent_classifier_improved.npy'
-W2V_MODEL_FILE = 'word2vec_model_improved.bin'
-CONFIDENCE_THRESHOLD = 0.6
-
-# Carregar SpaCy
-nlp = spacy.load('pt_core_news_sm', disable=['parser', 'ner'])
-
-
-# Carregar knowledge base
-with open('knowledge_base.json', 'r', encoding='utf-8') as f:
-    KNOWLEDGE_BASE = json.load(f)
-ID_TO_CONTENT = {item['id']: item for item in KNOWLEDGE_BASE}
-
-# Preparar documentos para BM25/TF-IDF
-DOC_TEXTS = [(str(item['id']), item['topic'] + ' ' + item['content'] + ' ' + ' '.join(item.get('keywords', []))) for item in KNOWLEDGE_BASE]
-DOC_STRS = [t for (_, t) in DOC_TEXTS]
-bm25 = BM25(DOC_STRS)
-vectorizer = TfidfVectorizer(lowercase=True)
-X_tfidf = vectorizer.fit_transform(DOC_STRS)
-
-# Funções de pré-processamento e embedding (mesmas do chatbot_mlp_improved.py)
-STOPWORDS = set(nltk.corpus.stopwords.words('portuguese')) - {'cuidador', 'idoso', 'saúde'}
-
-def preprocess_text(text):
-    doc = nlp(text.lower())
-    tokens = [token.lemma_ for token in doc if token.text not in STOPWORDS and len(token.text) > 2]
-    return tokens
-
-def get_sentence_embedding(tokens, w2v_model):
-    vectors = [w2v_model.wv[token] for token in tokens if token in w2v_model.wv]
-    return np.mean(vectors, axis=0) if vectors else np.zeros(w2v_model.vector_size)
-
-# Fallback search (mesmo do chatbot_mlp_improved.py)
-def fallback_search(query, top_k=3):
-    scores = bm25.get_scores(query)
-    ranked = sorted(scores, key=lambda x: x[1], reverse=True)[:top_k]
-    
-    q_vec = vectorizer.transform([query])
-    sims = cosine_similarity(q_vec, X_tfidf)[0]
-    ranked_tfidf = sims.argsort()[::-1][:top_k]
-    
-    results = []
-    seen_ids = set()
-    for idx, score in ranked:
-        if len(results) >= top_k:
-            break
-        item = KNOWLEDGE_BASE[idx]
-        if item['id'] not in seen_ids:
-            results.append({
-                'id': item['id'],
-                'topic': item['topic'],
-                'module': item.get('module'),
-                'content': item['content'],
-                'score': float(score)
-            })
-            seen_ids.add(item['id'])
-    
-    return results
-
-# Carregar modelos na inicialização do app
-w2v_model = Word2Vec.load(W2V_MODEL_FILE)
-mlp, le, scaler, vocab = np.load(MODEL_FILE, allow_pickle=True)
+logger = logging.getLogger('uvicorn.error')
+
+# Configurações (limiares: variável de ambiente > tuning.json gerado pelo sweep.py > padrão)
+TUNING = load_tuning(os.getenv('TUNING_FILE', TUNING_FILE))['runtime']
+CONFIDENCE_THRESHOLD = float(os.getenv('CONFIDENCE_THRESHOLD', TUNING['confidence_threshold']))
+BM25_BACKEND = os.getenv('BM25_BACKEND', 'python')  # 'python' (postings) ou 'sparse' (matriz CSR)
+MAX_BATCH_QUESTIONS = 256
+MICRO_BATCH_MAX_SIZE = int(os.getenv('MICRO_BATCH_MAX_SIZE', '32'))  # 1 desativa o micro-batching
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', '2'))
+# Pool de inferência: threads dedicadas (também limitam quantas perguntas cabem num micro-lote),
+# fila máxima além delas (acima disso 503 + Retry-After) e prazo por requisição (504)
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '16'))
+INFERENCE_MAX_QUEUE = int(os.getenv('INFERENCE_MAX_QUEUE', '64'))
+REQUEST_TIMEOUT_S = float(os.getenv('REQUEST_TIMEOUT_S', '10'))
+RETRY_AFTER_S = int(os.getenv('RETRY_AFTER_S', '1'))
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '1024'))  # 0 desativa o cache
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+# Fallback híbrido: fusão dos rankings BM25, TF-IDF e denso ('rrf', 'weighted' ou 'bm25' = só BM25)
+HYBRID_FUSION = os.getenv('HYBRID_FUSION', 'rrf')
+HYBRID_BM25_WEIGHT = float(os.getenv('HYBRID_BM25_WEIGHT', '1.0'))
+HYBRID_TFIDF_WEIGHT = float(os.getenv('HYBRID_TFIDF_WEIGHT', '1.0'))
+HYBRID_DENSE_WEIGHT = float(os.getenv('HYBRID_DENSE_WEIGHT', '0.5'))  # 0 desativa o estágio denso
+HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', '60'))
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '20'))
+# Um resultado do fallback é aceito se superar o limiar em pelo menos um dos estágios
+FALLBACK_MIN_BM25 = float(os.getenv('FALLBACK_MIN_BM25', TUNING['fallback_min_bm25']))
+FALLBACK_MIN_TFIDF = float(os.getenv('FALLBACK_MIN_TFIDF', TUNING['fallback_min_tfidf']))
+# cosseno > 1 nunca acontece: por padrão o denso só reordena, não torna um item relevante sozinho
+FALLBACK_MIN_DENSE = float(os.getenv('FALLBACK_MIN_DENSE', '1.0'))
+# Busca densa: 'exact' (produto matricial sobre todos os itens) ou 'ivf' (k-means, só n_probe listas)
+DENSE_ANN = os.getenv('DENSE_ANN', 'exact')
+DENSE_IVF_LISTS = int(os.getenv('DENSE_IVF_LISTS', '16'))
+DENSE_IVF_PROBE = int(os.getenv('DENSE_IVF_PROBE', '4'))
+# Trechos do guia devolvidos junto com a resposta em "passages" (0 desativa)
+PASSAGE_TOP_K = int(os.getenv('PASSAGE_TOP_K', '2'))
+PASSAGE_MIN_BM25 = float(os.getenv('PASSAGE_MIN_BM25', '4.0'))
+# Atalho antes do MLP para perguntas que são só um tópico/keyword de um único item (0 desativa)
+KEYWORD_ROUTER = os.getenv('KEYWORD_ROUTER', '1') == '1'
+# Correção de erros de digitação antes do atalho, do embedding e do BM25 (0 desativa)
+SPELL_CORRECTION = os.getenv('SPELL_CORRECTION', '1') == '1'
+SPELL_MAX_DISTANCE = int(os.getenv('SPELL_MAX_DISTANCE', '2'))
+# Autocompletar (/suggest): perguntas respondidas pelo MLP/atalho viram sugestões depois de N repetições (0 não aprende)
+SUGGEST_MIN_QUERY_COUNT = int(os.getenv('SUGGEST_MIN_QUERY_COUNT', str(MIN_QUERY_COUNT)))
+KB_ADMIN_TOKEN = os.getenv('KB_ADMIN_TOKEN')  # exigido no header X-Admin-Token da API /kb/items
+INDEX_BUNDLE = os.getenv('INDEX_BUNDLE', INDEX_BUNDLE_DIR)  # gerado por `python index_bundle.py build-index`
+
+# Vários knowledge bases no mesmo processo: os extras (kb_registry.json) são carregados no
+# primeiro uso e descarregados por LRU acima do orçamento; o padrão fica sempre carregado
+KB_REGISTRY = os.getenv('KB_REGISTRY', KB_REGISTRY_FILE)
+KB_MEMORY_BUDGET_MB = float(os.getenv('KB_MEMORY_BUDGET_MB', '512'))
+DEFAULT_KB_ID = 'default'
+# 'fast': tabela de lemas + regex, spaCy só para palavras fora da tabela; 'spacy': pipeline completo
+# (sem a variável: 'fast' para os KBs cujo bundle tem tabela de lemas)
+PREPROCESS_MODE = os.getenv('PREPROCESS_MODE')
+
+# Métricas (/metrics, formato Prometheus): latência por estágio do pipeline, origem das
+# respostas, distribuição da confiança do MLP, cache, pool de inferência e memória
+metrics = Registry()
+STAGE_SECONDS = metrics.histogram('dcare_stage_seconds', 'Latência de cada estágio do pipeline (por chamada)', ['stage'])
+REQUEST_SECONDS = metrics.histogram('dcare_request_seconds', 'Latência das requisições por endpoint', ['endpoint'])
+BATCH_SIZE = metrics.histogram('dcare_inference_batch_size', 'Perguntas por chamada de predict_intents',
+                               buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+ANSWERS = metrics.counter('dcare_answers_total', 'Respostas calculadas por origem', ['source'])
+CONFIDENCE = metrics.histogram('dcare_mlp_confidence', 'Probabilidade máxima do MLP por pergunta',
+                               buckets=tuple(i / 10 for i in range(1, 11)))
+REQUESTS = metrics.counter('dcare_requests_total', 'Requisições por endpoint e status', ['endpoint', 'status'])
+KEYWORD_ROUTES = metrics.counter('dcare_keyword_route_total', 'Perguntas vistas pelo atalho por palavra-chave, por resultado', ['outcome'])
+KEYWORD_OUTCOMES = ('hit', 'ambiguous', 'partial', 'miss')
+
+# FALLBACK FINAL: resposta amigável sugerindo reformulação (codificada uma vez)
+SYSTEM_FALLBACK = static_result(
+    "System Fallback", topic="Não entendi bem", module="Sistema",
+    content="Desculpe, não encontrei essa informação no guia. Tente reformular sua pergunta ou use palavras-chave mais simples (ex: 'banho', 'alimentação', 'diabetes').",
+    confidence=0.0)
+
+# SpaCy é carregado sob demanda (no modo 'fast' só quando aparece uma palavra desconhecida)
+# e compartilhado por todos os KBs do mesmo idioma
+@lru_cache(maxsize=None)
+def get_nlp(model=SPACY_MODEL):
+    return load_spacy(model)
+
+# cada carga de um KB ganha uma geração nova: um KB descarregado e recarregado recomeça
+# as versões do snapshot, e a geração na chave do cache separa as respostas das duas cargas
+_generations = itertools.count()
+
+class ServedKB:
+    def __init__(self, kb_id, bundle, kb_file=None, timings=None):
+        """
+        Tudo o que depende de um knowledge base: índices e MLP do bundle, pré-processamento,
+        snapshot atualizável pela API /kb/items, correção, atalho por palavra-chave e sugestões.
+        spaCy, pool de inferência, micro-batcher, cache de respostas e métricas são do processo.
+        kb_file: knowledge_base.json regravado a cada alteração pela API (None não persiste)
+        """
+        self.kb_id = kb_id
+        self.generation = next(_generations)
+        self.bundle = bundle
+        # matriz de vetores mapeada somente leitura e compartilhada via page cache entre os workers
+        self.embedder = bundle.embedder
+        self.mlp = bundle.mlp  # scaler já dobrado na primeira camada; pesos mapeados em memória
+        self.passage_index = bundle.passage_index
+        self.stopwords = bundle.stopwords
+        self.spacy_model = bundle.manifest.get('spacy_model', SPACY_MODEL)
+        self.memory_bytes = 0
+
+        mode = PREPROCESS_MODE or ('fast' if bundle.lemma_table is not None else 'spacy')
+        self.fast_preprocessor = (FastPreprocessor(bundle.lemma_table, self.stopwords, nlp_loader=self.nlp)
+                                  if mode == 'fast' else None)
+        if self.fast_preprocessor is None:
+            with phase(timings, 'spacy'):
+                self.nlp()  # modo spaCy: carrega junto com o KB, como antes
+
+        # Knowledge base atualizável pela API /kb/items: cada alteração publica um novo snapshot
+        # (índices + mapas de id); cada requisição lê kb.snapshot uma vez e usa só ele
+        self.kb = KBIndex(bundle.knowledge_base, bundle.bm25, bundle.vectorizer, bundle.tfidf_counts,
+                          bundle.dense_matrix, bundle.dense_mean,
+                          embed_docs=lambda texts: self.embedder.embed_batch(self.preprocess_batch(texts)),
+                          make_retriever=self.make_retriever,
+                          make_router=(lambda snapshot: KeywordRouter(snapshot.knowledge_base, self.stopwords))
+                                      if KEYWORD_ROUTER else None,
+                          kb_file=kb_file)
+
+        self.spell_corrector = None
+        if SPELL_CORRECTION:
+            with phase(timings, 'spelling'):
+                self.spell_corrector = self.build_spell_corrector()
+
+        # resultados do atalho por palavra-chave deste KB (o counter do /metrics soma todos os KBs);
+        # keyword_response só roda no event loop, então não precisa de trava
+        self.keyword_routes = dict.fromkeys(KEYWORD_OUTCOMES, 0)
+
+        self.suggester = Suggester(min_query_count=max(SUGGEST_MIN_QUERY_COUNT, 1))
+        self.suggester.load_kb(self.kb.snapshot.knowledge_base, self.kb.snapshot.version)
+
+    def nlp(self):
+        return get_nlp(self.spacy_model)
+
+    # Funções de pré-processamento (mesmas do chatbot_mlp_improved.py); o embedding fica em embeddings.py
+    def preprocess_batch(self, texts):
+        if self.fast_preprocessor is not None:
+            return self.fast_preprocessor.preprocess_batch(texts)
+        # nlp.pipe processa o lote inteiro de uma vez, sem o overhead por chamada
+        return _spacy_preprocess_batch(self.nlp(), texts, self.stopwords)
+
+    def preprocess_text(self, text):
+        return self.preprocess_batch([text])[0]
+
+    def build_spell_corrector(self):
+        # dicionário: termos do KB e do guia (com a frequência no corpus) e vocabulário do Word2Vec e da tabela de lemas
+        frequencies = term_frequencies(self.bundle.bm25)
+        if self.passage_index is not None:
+            for term, freq in term_frequencies(self.passage_index.bm25).items():
+                frequencies[term] = frequencies.get(term, 0) + freq
+        for word in list(self.embedder.key_to_index) + list(self.bundle.lemma_table or ()):
+            frequencies.setdefault(word, 1)
+        return SpellCorrector(frequencies, self.stopwords, max_distance=SPELL_MAX_DISTANCE)
+
+    # Fallback search: BM25 + TF-IDF + denso fundidos (TF-IDF e denso usam argpartition, sem ordenar tudo)
+    def make_retriever(self, snapshot):
+        dense_index = DenseIndex(snapshot.dense_matrix, self.bundle.dense_mean,
+                                 ann=IVFIndex(DENSE_IVF_LISTS, DENSE_IVF_PROBE) if DENSE_ANN == 'ivf' else None)
+        rankers = {'bm25': (BM25Ranker(snapshot.bm25), HYBRID_BM25_WEIGHT),
+                   'tfidf': (TfidfRanker(snapshot.tfidf.vectorizer, snapshot.tfidf.X), HYBRID_TFIDF_WEIGHT)}
+        if HYBRID_DENSE_WEIGHT > 0:
+            rankers['dense'] = (DenseRanker(dense_index, lambda text: self.embedder.embed(self.preprocess_text(text))),
+                                HYBRID_DENSE_WEIGHT)
+        rankers = {name: (TimedRanker(ranker, STAGE_SECONDS, name), weight) for name, (ranker, weight) in rankers.items()}
+        return HybridRetriever(
+            rankers, method=HYBRID_FUSION, rrf_k=HYBRID_RRF_K, candidates=HYBRID_CANDIDATES,
+            min_scores={'bm25': FALLBACK_MIN_BM25, 'tfidf': FALLBACK_MIN_TFIDF, 'dense': FALLBACK_MIN_DENSE},
+        )
+
+    def fallback_search(self, query, top_k=3, embedding=None, snapshot=None):
+        # embedding: vetor da pergunta já calculado para o MLP (evita pré-processar de novo)
+        # devolve os hits do retriever ({'index', 'score', 'scores'}); o índice é a linha do snapshot.store
+        snapshot = snapshot or self.kb.snapshot
+        context = {'embedding': embedding} if embedding is not None else None
+        with STAGE_SECONDS.time(stage='fallback'):
+            return snapshot.retriever.search(query, top_k, context)
+
+    # Trechos do guia: o texto exato do manual (com módulo, seção e offsets no arquivo)
+    def passage_search(self, query):
+        if self.passage_index is None or PASSAGE_TOP_K <= 0:
+            return []
+        with STAGE_SECONDS.time(stage='passages'):
+            return self.passage_index.search(query, PASSAGE_TOP_K, min_score=PASSAGE_MIN_BM25)
+
+    # Predição com MLP para um lote de perguntas: um nlp.pipe, uma matriz de embeddings
+    # e um único forward (o argmax sai das próprias probabilidades). Cada predição leva
+    # também o embedding da pergunta, reaproveitado pelo estágio denso do fallback.
+    # (o scaler está dobrado na primeira camada do MLP, então não há estágio de escala separado)
+    def predict_intents(self, questions):
+        with STAGE_SECONDS.time(stage='preprocess'):
+            token_lists = self.preprocess_batch(questions)
+        with STAGE_SECONDS.time(stage='embed'):
+            X = self.embedder.embed_batch(token_lists)
+
+        with STAGE_SECONDS.time(stage='mlp'):
+            probs = self.mlp.predict_proba(X)
+            best = probs.argmax(axis=1)
+            max_probs = probs[np.arange(len(best)), best]
+            intent_ids = self.mlp.classes[best]
+        for p in max_probs.tolist():
+            CONFIDENCE.observe(p)
+        return list(zip(max_probs.tolist(), intent_ids.tolist(), X))
+
+    def build_results(self, question, max_prob, intent_id, top_k, embedding=None, snapshot=None):
+        # os resultados saem com o JSON pronto (kb_store): só confiança/scores são codificados aqui
+        snapshot = snapshot or self.kb.snapshot
+        store = snapshot.store
+        results = []
+
+        # 2. Verifica se é MLP com alta confiança (o item pode ter sido removido pela API /kb/items)
+        row = store.row_of.get(intent_id) if max_prob > CONFIDENCE_THRESHOLD else None
+        if row is not None:
+            ANSWERS.inc(source="MLP")
+            results.append(store.result(row, "MLP", confidence=float(max_prob)))
+        else:
+            # 3. Fallback para BM25/TF-IDF/denso se MLP falhar
+            # (só vêm resultados acima do limiar mínimo de BM25 ou de TF-IDF)
+            valid_fallback = self.fallback_search(question, top_k, embedding, snapshot)
+
+            if valid_fallback:
+                ANSWERS.inc(source="Fallback Search")
+                bm25_scores = None
+                for hit in valid_fallback:
+                    # "score" continua sendo o BM25 bruto (comparável com FALLBACK_MIN_BM25 e com as
+                    # respostas antigas); o valor da fusão vai em "fused_score"
+                    bm25_score = hit['scores'].get('bm25')
+                    if bm25_score is None:
+                        # item trazido só pelo TF-IDF/denso, fora dos candidatos do BM25
+                        if bm25_scores is None:
+                            bm25_scores = snapshot.bm25.get_scores(question)  # [(índice, score)]
+                        bm25_score = bm25_scores[hit['index']][1]
+                    results.append(store.result(hit['index'], "Fallback Search", score=float(bm25_score),
+                                                fused_score=float(hit['score']), scores=hit['scores']))
+            else:
+                # 4. FALLBACK FINAL (Nenhum modelo encontrou resposta relevante)
+                # Retornamos a resposta amigável sugerindo reformulação
+                ANSWERS.inc(source="System Fallback")
+                results.append(SYSTEM_FALLBACK)
+
+        return results
+
+    def build_response(self, question, max_prob, intent_id, top_k, embedding=None, snapshot=None):
+        return {"results": self.build_results(question, max_prob, intent_id, top_k, embedding, snapshot),
+                "passages": self.passage_search(question)}
+
+    def needs_correction(self, question, snapshot):
+        # só consultas a conjuntos: roda no event loop e evita o pool quando todas as palavras são conhecidas
+        # (termos de itens criados pela API /kb/items depois da carga também contam como conhecidos)
+        return self.spell_corrector is not None and \
+            self.spell_corrector.needs_lookup(question, known=lambda word: word in snapshot.bm25.postings)
+
+    def correct_question(self, question, snapshot):
+        # roda no pool de inferência; não carrega o spaCy: o vocabulário do Word2Vec e a tabela
+        # de lemas já estão no dicionário do corretor
+        if self.spell_corrector is None:
+            return question
+        with STAGE_SECONDS.time(stage='spelling'):
+            return self.spell_corrector.correct(
+                question, known=lambda word: word in snapshot.bm25.postings)
+
+    def correct_questions(self, questions, snapshot):
+        return [self.correct_question(question, snapshot) for question in questions]
+
+    def keyword_response(self, question, snapshot):
+        # resposta direta (sem spaCy/Word2Vec/MLP) quando a pergunta nomeia um único item; senão None
+        if snapshot.router is None:
+            return None
+        with STAGE_SECONDS.time(stage='keyword'):
+            intent_id, outcome = snapshot.router.route(question)
+        KEYWORD_ROUTES.inc(outcome=outcome)
+        self.keyword_routes[outcome] += 1
+        row = snapshot.store.row_of.get(intent_id)
+        if row is None:
+            return None
+        ANSWERS.inc(source="Keyword")
+        return {"results": [snapshot.store.result(row, "Keyword", confidence=1.0)],
+                "passages": self.passage_search(question)}
+
+    def learn_query(self, question, response):
+        # só perguntas bem resolvidas (MLP com confiança ou atalho) alimentam o autocompletar
+        if SUGGEST_MIN_QUERY_COUNT > 0 and response['results'][0].source in ('MLP', 'Keyword'):
+            self.suggester.record(response.get('corrected_query', question))
+
+    def suggest(self, prefix, k):
+        snapshot = self.kb.snapshot
+        if self.suggester.kb_version != snapshot.version:
+            self.suggester.load_kb(snapshot.knowledge_base, snapshot.version)
+        return self.suggester.suggest(prefix, k)
+
+    def answer_question(self, question, top_k, snapshot):
+        # 1. Predição com MLP (agrupada com outras requisições concorrentes, de qualquer KB)
+        max_prob, intent_id, embedding = predict_intent(self, question)
+        return self.build_response(question, max_prob, intent_id, top_k, embedding, snapshot)
+
+    def answer_questions(self, questions, top_k, snapshot):
+        BATCH_SIZE.observe(len(questions))
+        predictions = self.predict_intents(questions)
+        return [self.build_response(question, max_prob, intent_id, top_k, embedding, snapshot)
+                for question, (max_prob, intent_id, embedding) in zip(questions, predictions)]
+
+    def stats(self):
+        snapshot = self.kb.snapshot
+        counts = dict(self.keyword_routes)
+        total = sum(counts.values())
+        return {"kb_id": self.kb_id, "generation": self.generation, "items": len(snapshot.id_to_content), "kb_version": snapshot.version,
+                "passages": len(self.passage_index) if self.passage_index is not None else 0,
+                "preprocess": self.fast_preprocessor.stats() if self.fast_preprocessor is not None else {"mode": "spacy"},
+                "keyword_router": {"enabled": snapshot.router is not None,
+                                   "terms": len(snapshot.router.terms) if snapshot.router is not None else 0, **counts,
+                                   "hit_rate": round(counts['hit'] / total, 4) if total else 0.0},
+                "spelling": self.spell_corrector.stats() if self.spell_corrector is not None else {"enabled": False},
+                "suggest": self.suggester.stats(),
+                "index": {"created_at": self.bundle.manifest.get('created_at'),
+                          "quantization": self.bundle.manifest.get('quantization'),
+                          "language": self.bundle.manifest.get('language', STOPWORDS_LANGUAGE)}}
+
+# Carregar todos os artefatos de serving do KB padrão: do bundle pré-computado quando existir
+# (sem rede e sem refazer fit), senão a partir dos arquivos de origem
+STARTUP_TIMINGS = {}
+_startup = time.perf_counter()
+if os.path.isdir(INDEX_BUNDLE):
+    bundle = IndexBundle.load(INDEX_BUNDLE, bm25_backend=BM25_BACKEND, timings=STARTUP_TIMINGS)
+    stale = bundle.stale_sources()
+    if stale:
+        # ex.: knowledge_base.json alterado pela API /kb/items desde o último build-index
+        logger.warning("Bundle de índices desatualizado em relação a %s; construindo a partir dos arquivos de origem "
+                       "(rode build-index)", ', '.join(stale))
+        bundle = IndexBundle.from_sources(bm25_backend=BM25_BACKEND, timings=STARTUP_TIMINGS)
+else:
+    logger.warning("Bundle de índices não encontrado em %s; construindo a partir dos arquivos de origem", INDEX_BUNDLE)
+    bundle = IndexBundle.from_sources(bm25_backend=BM25_BACKEND, timings=STARTUP_TIMINGS)
+
+default_kb = ServedKB(DEFAULT_KB_ID, bundle, kb_file=KB_FILE, timings=STARTUP_TIMINGS)
+
+STARTUP_TIMINGS['total'] = round((time.perf_counter() - _startup) * 1000, 2)
+logger.info("Tempos de inicialização (ms): %s", STARTUP_TIMINGS)
+
+def load_extra_kb(kb_id, spec):
+    # KBs extras só vêm de bundles prontos (build-index com --kb/--model/--vectors do guia)
+    timings = {}
+    bundle = IndexBundle.load(spec['bundle'], bm25_backend=BM25_BACKEND, timings=timings)
+    stale = [source for source in bundle.stale_sources() if source != spec.get('kb_file')]
+    if stale:
+        logger.warning("Bundle do KB %s desatualizado em relação a %s (rode build-index)", kb_id, ', '.join(stale))
+    served = ServedKB(kb_id, bundle, kb_file=spec.get('kb_file'), timings=timings)
+    if served.kb.kb_file and os.path.exists(served.kb.kb_file):
+        # edições da API /kb/items gravadas depois do build-index (inclusive antes de uma
+        # descarga por LRU) são reaplicadas sobre o bundle, item a item
+        with phase(timings, 'kb_sync'):
+            served.kb.sync(force=True)
+    served.memory_bytes = directory_bytes(spec['bundle'])
+    logger.info("Tempos de carga do KB %s (ms): %s", kb_id, timings)
+    return served
+
+registry = KBRegistry(load_registry(KB_REGISTRY), load_extra_kb, int(KB_MEMORY_BUDGET_MB * 2**20),
+                      pinned={DEFAULT_KB_ID: default_kb})
+
+# Micro-batching: requisições concorrentes de /query são agrupadas (um forward por KB no lote)
+def predict_grouped(items):
+    groups = {}
+    for i, (served, question) in enumerate(items):
+        groups.setdefault(id(served), (served, []))[1].append(i)
+    outputs = [None] * len(items)
+    BATCH_SIZE.observe(len(items))
+    for served, indices in groups.values():
+        for i, prediction in zip(indices, served.predict_intents([items[i][1] for i in indices])):
+            outputs[i] = prediction
+    return outputs
+
+batcher = MicroBatcher(predict_grouped, MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS) if MICRO_BATCH_MAX_SIZE > 1 else None
+
+def predict_intent(served, question):
+    if batcher is None:
+        return predict_grouped([(served, question)])[0]
+    return batcher.submit((served, question)).result()
+
+# Cache das respostas por (KB, pergunta normalizada, top_k, versão); é esvaziado quando o
+# knowledge base ou os arquivos de modelo mudam no disco
+response_cache = ResponseCache(
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL,
+    watch_files=[KB_FILE, MODEL_FILE, W2V_VECTORS_FILE, W2V_VECTORS_FILE + '.vectors.npy', GUIDE_FILE,
+                 os.path.join(INDEX_BUNDLE, 'manifest.json')],
+)
+
+def _labeled(stats, keys):
+    return {(key,): stats[key] for key in keys}
+
+metrics.gauge('dcare_cache_events', 'Eventos do cache de respostas (acumulados)', ['event'],
+              callback=lambda: _labeled(response_cache.stats(), ('hits', 'misses', 'evictions', 'invalidations')))
+metrics.gauge('dcare_cache_entries', 'Entradas no cache de respostas', callback=lambda: response_cache.stats()['size'])
+metrics.gauge('dcare_cache_hit_rate', 'Taxa de acerto do cache de respostas', callback=lambda: response_cache.stats()['hit_rate'])
+metrics.gauge('dcare_inference_pool', 'Estado do pool de inferência (in_flight atual; rejected/expired acumulados)', ['state'],
+              callback=lambda: _labeled(executor.stats(), ('in_flight', 'rejected', 'expired')))
+metrics.gauge('dcare_kb_items', 'Itens no knowledge base padrão', callback=lambda: len(default_kb.kb.snapshot.id_to_content))
+metrics.gauge('dcare_kb_registry_events', 'Cargas e descargas de knowledge bases extras (acumuladas)', ['event'],
+              callback=lambda: _labeled(registry.stats(), ('hits', 'loads', 'load_errors', 'evictions')))
+metrics.gauge('dcare_kb_loaded', 'Knowledge bases extras carregados', callback=lambda: len(registry.stats()['loaded']))
+metrics.gauge('dcare_process_resident_memory_bytes', 'Memória residente do processo', callback=process_rss_bytes)
 
 app = FastAPI(title="ChatBot D-Care - API", version="1.0")
 
@@ -92,113 +435,248 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # rota com o parâmetro ("/kb/items/{item_id}"), não o caminho, para não explodir os labels
+    route = request.scope.get('route')
+    endpoint = route.path if route is not None else 'unmatched'
+    REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+    return response
+
 class Query(BaseModel):
     question: str
     top_k: Optional[int] = 3
+    timeout_ms: Optional[int] = None  # prazo da requisição (limitado a REQUEST_TIMEOUT_S)
+    kb_id: Optional[str] = None  # knowledge base consultado (None = padrão)
+
+class QueryBatch(BaseModel):
+    questions: List[str]
+    top_k: Optional[int] = 3
+    timeout_ms: Optional[int] = None
+    kb_id: Optional[str] = None
+
+class KBItem(BaseModel):
+    id: int
+    topic: str
+    content: str
+    keywords: List[str] = []
+    module: Optional[str] = None
+
+    def to_item(self):
+        return self.model_dump(exclude_none=True)
+
+def with_correction(response, question, corrected):
+    # a pergunta corrigida volta na resposta (o frontend pode mostrar "você quis dizer")
+    return response if corrected == question else {"corrected_query": corrected, **response}
+
+# Todo o trabalho de CPU de uma requisição roda no pool de inferência, fora do event loop
+executor = BoundedExecutor(INFERENCE_WORKERS, INFERENCE_MAX_QUEUE)
+
+def request_timeout(timeout_ms):
+    if timeout_ms is None:
+        return REQUEST_TIMEOUT_S
+    return min(max(timeout_ms, 1) / 1000.0, REQUEST_TIMEOUT_S)
+
+async def run_inference(fn, *args, timeout):
+    try:
+        return await executor.run(fn, *args, timeout=timeout)
+    except Overloaded:
+        raise HTTPException(status_code=503, detail="Servidor sobrecarregado, tente novamente em instantes.",
+                            headers={"Retry-After": str(RETRY_AFTER_S)})
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Tempo limite da requisição excedido.")
+
+# Sincronizações do KB com o arquivo em andamento (referências para as tasks não serem coletadas)
+_sync_tasks = set()
+
+def _sync_done(task):
+    _sync_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Falha ao sincronizar o knowledge base com o arquivo", exc_info=task.exception())
+
+def schedule_kb_sync(served):
+    # stat e, se o arquivo mudou, o sync inteiro (re-embedding, índices, atalho) numa thread:
+    # o event loop não para, e as requisições seguem com o snapshot atual até a troca
+    if served.kb.check_due():
+        task = asyncio.ensure_future(run_in_threadpool(served.kb.sync_if_changed))
+        _sync_tasks.add(task)
+        task.add_done_callback(_sync_done)
+
+async def resolve_kb(kb_id):
+    # KB já carregado: direto no event loop; senão a carga (segundos) roda numa thread,
+    # e requisições simultâneas para o mesmo KB esperam a mesma carga
+    kb_id = kb_id or DEFAULT_KB_ID
+    served = registry.peek(kb_id)
+    if served is None:
+        try:
+            served = await run_in_threadpool(registry.get, kb_id)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Knowledge base '{kb_id}' não encontrado.")
+    schedule_kb_sync(served)
+    return served
 
 @app.get("/health")
-def health():
-    return {"status": "ok", "items": len(KNOWLEDGE_BASE)}
+def health(kb_id: Optional[str] = None):
+    served = registry.peek(kb_id or DEFAULT_KB_ID)
+    if served is None:
+        if (kb_id or DEFAULT_KB_ID) not in registry:
+            raise HTTPException(status_code=404, detail=f"Knowledge base '{kb_id}' não encontrado.")
+        return {"status": "ok", "kb_id": kb_id, "loaded": False, "kbs": registry.stats()}
+    stats = served.stats()
+    stats["index"]["startup_ms"] = STARTUP_TIMINGS if served is default_kb else None
+    return {"status": "ok", **stats, "cache": response_cache.stats(), "inference": executor.stats(),
+            "thresholds": {"confidence": CONFIDENCE_THRESHOLD, "min_bm25": FALLBACK_MIN_BM25, "min_tfidf": FALLBACK_MIN_TFIDF},
+            "kbs": registry.stats()}
 
 
 @app.post("/query")
-def query(q: Query):
+async def query(q: Query):
     question = q.question
     top_k = q.top_k or 3
+    served = await resolve_kb(q.kb_id)
 
-    # 1. Predição com MLP
-    tokens = preprocess_text(question)
-    embedding = get_sentence_embedding(tokens, w2v_model)
-    embedding = scaler.transform([embedding])
-    
-    probs = mlp.predict_proba(embedding)[0]
-    max_prob = np.max(probs)
-    pred = mlp.predict(embedding)[0]
-    intent_id = le.inverse_transform([pred])[0]
-    
-    results = []
-    
-    # 2. Verifica se é MLP com alta confiança
-    if max_prob > CONFIDENCE_THRESHOLD and intent_id in ID_TO_CONTENT:
-        item = ID_TO_CONTENT[intent_id]
-        results.append({
-            "topic": item['topic'],
-            "module": item.get('module', 'Geral'),
-            "content": item['content'],
-            "confidence": float(max_prob),
-            "source": "MLP"
-        })
-    else:
-        # 3. Fallback para BM25/TF-IDF se MLP falhar
-        fallback_results = fallback_search(question, top_k)
-        
-        # Filtra resultados do fallback que tenham um score mínimo aceitável
-        # (BM25 scores variam, mas geralmente algo > 0 mostra relevância)
-        valid_fallback = [res for res in fallback_results if res['score'] > 1.0] 
-        
-        if valid_fallback:
-            for res in valid_fallback:
-                results.append({
-                    "topic": res['topic'],
-                    "module": res.get('module', 'Geral'),
-                    "content": res['content'],
-                    "score": res['score'],
-                    "source": "Fallback Search"
-                })
+    # geração e versão do snapshot entram na chave: respostas de um knowledge base antigo não são reaproveitadas
+    snapshot = served.kb.snapshot
+    key = (served.kb_id, served.generation, normalize_question(question), top_k, snapshot.version)
+    response = response_cache.get(key)
+    if response is None:
+        # atalho por palavra-chave: microssegundos, roda no próprio event loop; a correção
+        # (quando alguma palavra é desconhecida) vai para o pool de inferência
+        timeout = request_timeout(q.timeout_ms)
+        corrected = question
+        if served.needs_correction(question, snapshot):
+            corrected = await run_inference(served.correct_question, question, snapshot, timeout=timeout)
+        response = served.keyword_response(corrected, snapshot)
+        if response is None:
+            response = await run_inference(served.answer_question, corrected, top_k, snapshot, timeout=timeout)
+            response = with_correction(response, question, corrected)
+            response_cache.put(key, response)
         else:
-            # 4. FALLBACK FINAL (Nenhum modelo encontrou resposta relevante)
-            # Retornamos a resposta amigável sugerindo reformulação
-            return {
-                "query": question,
-                "results": [{
-                    "topic": "Não entendi bem",
-                    "module": "Sistema",
-                    "content": "Desculpe, não encontrei essa informação no guia. Tente reformular sua pergunta ou use palavras-chave mais simples (ex: 'banho', 'alimentação', 'diabetes').",
-                    "confidence": 0.0,
-                    "source": "System Fallback"
-                }]
-            }
-    
-    return {"query": question, "results": results}
-    question = q.question
+            response = with_correction(response, question, corrected)
+    served.learn_query(question, response)
+    return Response(encode_response(question, response), media_type="application/json")
+
+@app.post("/query_batch")
+async def query_batch(q: QueryBatch):
+    if len(q.questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"Máximo de {MAX_BATCH_QUESTIONS} perguntas por lote.")
+    if not q.questions:
+        return {"responses": []}
+
     top_k = q.top_k or 3
+    served = await resolve_kb(q.kb_id)
+    snapshot = served.kb.snapshot
+    keys = [(served.kb_id, served.generation, normalize_question(question), top_k, snapshot.version)
+            for question in q.questions]
+    responses = [response_cache.get(key) for key in keys]
+    timeout = request_timeout(q.timeout_ms)
+    corrected = list(q.questions)
+    to_correct = [i for i, response in enumerate(responses)
+                  if response is None and served.needs_correction(q.questions[i], snapshot)]
+    if to_correct:
+        fixed = await run_inference(served.correct_questions, [q.questions[i] for i in to_correct], snapshot,
+                                    timeout=timeout)
+        for i, text in zip(to_correct, fixed):
+            corrected[i] = text
+    for i, response in enumerate(responses):
+        if response is None:
+            response = served.keyword_response(corrected[i], snapshot)
+            responses[i] = with_correction(response, q.questions[i], corrected[i]) if response is not None else None
+
+    # só as perguntas fora do cache passam pelo pipeline, num único lote
+    missing = [i for i, response in enumerate(responses) if response is None]
+    if missing:
+        computed = await run_inference(served.answer_questions, [corrected[i] for i in missing], top_k, snapshot,
+                                       timeout=timeout)
+        for i, response in zip(missing, computed):
+            responses[i] = with_correction(response, q.questions[i], corrected[i])
+            response_cache.put(keys[i], responses[i])
+    for question, response in zip(q.questions, responses):
+        served.learn_query(question, response)
+
+    return Response(encode_responses(q.questions, responses), media_type="application/json")
+
+@app.get("/suggest")
+async def suggest(q: str = '', k: int = SUGGEST_TOP_K, kb_id: Optional[str] = None):
+    # a cada tecla: sem pool de inferência, só a descida na trie (microssegundos)
+    served = await resolve_kb(kb_id)
+    return {"query": q, "suggestions": served.suggest(q, max(k, 1))}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# API de administração do knowledge base: desativada se KB_ADMIN_TOKEN não estiver definido
+def check_admin(token):
+    if not KB_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="API de administração desativada (defina KB_ADMIN_TOKEN).")
+    if not token or not hmac.compare_digest(token, KB_ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Token de administração inválido.")
+
+def admin_kb(kb_id):
+    # handlers síncronos (threadpool): pode carregar o KB aqui mesmo
+    try:
+        return registry.get(kb_id or DEFAULT_KB_ID).kb
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Knowledge base '{kb_id}' não encontrado.")
+
+@app.post("/kb/items", status_code=201)
+def create_kb_item(item: KBItem, kb_id: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    check_admin(x_admin_token)
+    kb = admin_kb(kb_id)
+    try:
+        kb.add(item.to_item())
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"item": item.to_item(), "kb_version": kb.snapshot.version}
+
+@app.put("/kb/items/{item_id}")
+def update_kb_item(item_id: int, item: KBItem, kb_id: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    check_admin(x_admin_token)
+    if item.id != item_id:
+        raise HTTPException(status_code=400, detail="O id do corpo difere do id da URL.")
+    kb = admin_kb(kb_id)
+    try:
+        kb.update(item.to_item())
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Item {item_id} não encontrado.")
+    return {"item": item.to_item(), "kb_version": kb.snapshot.version}
+
+@app.delete("/kb/items/{item_id}")
+def delete_kb_item(item_id: int, kb_id: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    check_admin(x_admin_token)
+    kb = admin_kb(kb_id)
+    try:
+        kb.delete(item_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Item {item_id} não encontrado.")
+    return {"deleted": item_id, "kb_version": kb.snapshot.version}
+
+# Profiler por amostragem ligado sob demanda (mesmo token da API de administração):
+# POST /debug/profiler/start, depois POST /debug/profiler/stop devolve as pilhas no formato "collapsed"
+profiler = SamplingProfiler()
+
+@app.post("/debug/profiler/start")
+def start_profiler(interval_ms: float = 5.0, x_admin_token: Optional[str] = Header(None)):
+    check_admin(x_admin_token)
+    if not profiler.start(max(interval_ms, 1.0)):
+        raise HTTPException(status_code=409, detail="Profiler já está rodando.")
+    return profiler.stats()
+
+@app.post("/debug/profiler/stop", response_class=PlainTextResponse)
+def stop_profiler(x_admin_token: Optional[str] = Header(None)):
+    check_admin(x_admin_token)
+    return PlainTextResponse(profiler.stop())
 
-    # Predição com MLP
-    tokens = preprocess_text(question)
-    embedding = get_sentence_embedding(tokens, w2v_model)
-    embedding = scaler.transform([embedding])
-    
-    probs = mlp.predict_proba(embedding)[0]
-    max_prob = np.max(probs)
-    pred = mlp.predict(embedding)[0]
-    intent_id = le.inverse_transform([pred])[0]
-    
-    results = []
-    if max_prob > CONFIDENCE_THRESHOLD and intent_id in ID_TO_CONTENT:
-        item = ID_TO_CONTENT[intent_id]
-        results.append({
-            "topic": item['topic'],
-            "module": item.get('module', 'Geral'),
-            "content": item['content'],
-            "confidence": float(max_prob),
-            "source": "MLP"
-        })
-    else:
-        # Fallback para BM25/TF-IDF
-        fallback_results = fallback_search(question, top_k)
-        for res in fallback_results:
-            results.append({
-                "topic": res['topic'],
-                "module": res.get('module', 'Geral'),
-                "content": res['content'],
-                "score": res['score'],
-                "source": "Fallback Search"
-            })
-    
-    if not results:
-        raise HTTPException(status_code=404, detail="Nenhuma resposta encontrada. Tente reformular a pergunta.")
-    
-    return {"query": question, "results": results}
+@app.get("/debug/profiler")
+def profiler_status(x_admin_token: Optional[str] = Header(None)):
+    check_admin(x_admin_token)
+    return profiler.stats()
 
+# Desenvolvimento: `python app.py` (RELOAD=1 recarrega ao editar o código).
+# Produção: `gunicorn -c gunicorn.conf.py app:app` (vários workers, modelos pré-carregados).
 if __name__ == "__main__":
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=os.getenv('RELOAD') == '1')
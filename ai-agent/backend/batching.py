@@ -0,0 +1,62 @@
+# batching.py - Fila de micro-batching para agrupar perguntas concorrentes
+# em uma única chamada de inferência (spaCy/Word2Vec/scaler/MLP)
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class MicroBatcher:
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=2.0):
+        """
+        batch_fn: função que recebe uma lista de entradas e retorna uma lista
+                  de resultados na mesma ordem
+        max_batch_size: tamanho máximo de cada lote
+        max_wait_ms: tempo máximo que o primeiro item espera por companhia
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_worker(self):
+        # thread iniciada no primeiro uso e de novo após fork (ex.: gunicorn --preload)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._worker.start()
+                self._pid = os.getpid()
+
+    def submit(self, item):
+        if self._pid != os.getpid():
+            self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self):
+        # bloqueia até o primeiro item e junta o que chegar dentro da janela
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                outputs = self.batch_fn(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), output in zip(batch, outputs):
+                future.set_result(output)
@@ -0,0 +1,363 @@
+# benchmark.py - Testes de carga e micro-benchmarks reprodutíveis do backend
+# corpus: perguntas de generate_synthetic_data() com ruído de paráfrase (semente fixa)
+# replay: reenvia o corpus ao /query no próprio processo (ASGI) ou por HTTP, com N requisições
+#         simultâneas; mede p50/p95/p99, vazão e memória residente
+# micro:  BM25.get_scores, pré-processamento, embedding médio e MLP sobre um KB sintético 10x/100x/1000x
+# compare: compara dois JSON de resultados e aponta regressões
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import time
+import unicodedata
+
+import numpy as np
+
+from metrics import process_rss_bytes
+
+BENCH_SEED = 42
+CORPUS_SIZE = 500
+NOISE_RATE = 0.5  # fração das perguntas que recebem ruído de paráfrase
+SCALES = (10, 100, 1000)
+MICRO_QUERIES = 200
+# métricas comparadas por `compare`: maior é pior, exceto as de vazão
+LOWER_IS_BETTER = ('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'build_ms', 'rss_mb')
+HIGHER_IS_BETTER = ('throughput_rps', 'ops_per_s')
+
+FILLERS = ("por favor", "me diga", "gostaria de saber", "uma dúvida:", "preciso de ajuda,")
+WORD_RE = re.compile(r"\w+")
+
+# Corpus: as mesmas frases do treino do MLP, com ruído que o usuário real produz
+def strip_accents(text):
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
+
+def typo(word, rng):
+    if len(word) < 4:
+        return word
+    i = rng.randrange(len(word) - 1)
+    op = rng.choice(('swap', 'drop', 'double'))
+    if op == 'swap':
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if op == 'drop':
+        return word[:i] + word[i + 1:]
+    return word[:i] + word[i] + word[i:]
+
+def add_noise(text, rng):
+    words = text.split()
+    ops = rng.sample(('typo', 'drop', 'accents', 'case', 'filler'), k=rng.randint(1, 2))
+    if 'typo' in ops and words:
+        i = rng.randrange(len(words))
+        words[i] = typo(words[i], rng)
+    if 'drop' in ops and len(words) > 2:
+        del words[rng.randrange(len(words))]
+    text = ' '.join(words)
+    if 'accents' in ops:
+        text = strip_accents(text)
+    if 'case' in ops:
+        text = rng.choice((str.lower, str.upper, str.capitalize))(text)
+    if 'filler' in ops:
+        text = f"{rng.choice(FILLERS)} {text}"
+    return text
+
+def build_corpus(size=CORPUS_SIZE, seed=BENCH_SEED, noise_rate=NOISE_RATE):
+    # importa o script de treino só aqui: carrega spaCy e NLTK na importação
+    from chatbot_ml import generate_synthetic_data
+    data, labels = generate_synthetic_data()
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        i = rng.randrange(len(data))
+        noisy = rng.random() < noise_rate
+        corpus.append({"question": add_noise(data[i], rng) if noisy else data[i],
+                       "label": int(labels[i]), "noisy": noisy})
+    return corpus
+
+def load_corpus(path, size, seed, noise_rate):
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    corpus = build_corpus(size, seed, noise_rate)
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(corpus, f, ensure_ascii=False, indent=2)
+    return corpus
+
+# Estatísticas
+def latency_summary(seconds):
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    if not len(ms):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"count": int(len(ms)), "p50_ms": round(float(p50), 4), "p95_ms": round(float(p95), 4),
+            "p99_ms": round(float(p99), 4), "mean_ms": round(float(ms.mean()), 4), "max_ms": round(float(ms.max()), 4)}
+
+def peak_rss_bytes():
+    # ru_maxrss vem em KiB no Linux (bytes no macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def mb(n_bytes):
+    return round(n_bytes / 2 ** 20, 2) if n_bytes is not None else None
+
+def time_calls(fn, args_list, repeat=1):
+    # uma medida por chamada (perf_counter), depois do aquecimento com o primeiro argumento
+    fn(args_list[0])
+    seconds = []
+    for _ in range(repeat):
+        for args in args_list:
+            start = time.perf_counter()
+            fn(args)
+            seconds.append(time.perf_counter() - start)
+    summary = latency_summary(seconds)
+    summary["ops_per_s"] = round(len(seconds) / sum(seconds), 2) if sum(seconds) else None
+    return summary
+
+# Replay do corpus contra /query
+async def replay(client, questions, concurrency, top_k=3):
+    """
+    Dispara as perguntas com no máximo `concurrency` requisições em andamento.
+    Retorna latências (só das respostas 200), contagem por status e duração total.
+    """
+    queue = iter(questions)
+    latencies, statuses = [], {}
+
+    async def worker():
+        for question in queue:
+            start = time.perf_counter()
+            try:
+                response = await client.post('/query', json={'question': question, 'top_k': top_k})
+                status = str(response.status_code)
+            except Exception as e:  # conexão recusada, timeout: conta como erro e segue
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == '200':
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - start
+
+def replay_result(latencies, statuses, elapsed, concurrency):
+    return {"concurrency": concurrency, "requests": sum(statuses.values()), "statuses": statuses,
+            "duration_s": round(elapsed, 3), "throughput_rps": round(sum(statuses.values()) / elapsed, 2),
+            **latency_summary(latencies)}
+
+async def replay_in_process(questions, concurrencies, warmup, top_k):
+    # sem cache por padrão: cada pergunta repetida passaria a medir só o LRU
+    os.environ.setdefault('RESPONSE_CACHE_SIZE', '0')
+    import httpx
+    rss_before = process_rss_bytes()
+    start = time.perf_counter()
+    import app
+    load_s = time.perf_counter() - start
+    results = {"startup_s": round(load_s, 3), "rss_after_load_mb": mb(process_rss_bytes()), "runs": []}
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=60) as client:
+        await replay(client, questions[:warmup], 1, top_k)
+        for concurrency in concurrencies:
+            run = replay_result(*await replay(client, questions, concurrency, top_k), concurrency)
+            run["rss_mb"] = mb(process_rss_bytes())
+            results["runs"].append(run)
+    results["rss_before_load_mb"] = mb(rss_before)
+    results["peak_rss_mb"] = mb(peak_rss_bytes())
+    return results
+
+def server_rss_bytes(metrics_text):
+    # RSS do worker que respondeu ao /metrics (com vários workers, é só um deles)
+    for line in metrics_text.splitlines():
+        if line.startswith('dcare_process_resident_memory_bytes '):
+            return float(line.split()[1])
+    return None
+
+async def replay_http(url, questions, concurrencies, warmup, top_k):
+    import httpx
+    results = {"url": url, "runs": []}
+    limits = httpx.Limits(max_connections=max(concurrencies), max_keepalive_connections=max(concurrencies))
+    async with httpx.AsyncClient(base_url=url.rstrip('/'), timeout=60, limits=limits) as client:
+        await replay(client, questions[:warmup], 1, top_k)
+        for concurrency in concurrencies:
+            run = replay_result(*await replay(client, questions, concurrency, top_k), concurrency)
+            try:
+                response = await client.get('/metrics')
+                run["rss_mb"] = mb(server_rss_bytes(response.text))
+            except Exception:
+                run["rss_mb"] = None
+            results["runs"].append(run)
+    return results
+
+# Micro-benchmarks sobre um KB sintético maior
+def scaled_documents(texts, factor, rng):
+    """
+    factor cópias de cada documento, com ~30% das palavras trocadas por palavras sorteadas
+    do próprio KB (na frequência em que aparecem): vocabulário e df realistas, sem documentos idênticos.
+    """
+    pool = [w for text in texts for w in WORD_RE.findall(text.lower())]
+    docs = []
+    for text in texts:
+        words = text.split()
+        for _ in range(factor):
+            docs.append(' '.join(rng.choice(pool) if rng.random() < 0.3 else w for w in words))
+    return docs
+
+def random_mlp(mlp, n_classes, rng):
+    # mesmas camadas ocultas do modelo treinado, saída com uma classe por item do KB escalado
+    from mlp_numpy import NumpyMLP
+    sizes = [np.asarray(W).shape[0] for W in mlp.weights] + [n_classes]
+    gen = np.random.default_rng(rng.randrange(2 ** 32))
+    weights = [gen.standard_normal((a, b)) * np.sqrt(2.0 / a) for a, b in zip(sizes[:-1], sizes[1:])]
+    biases = [np.zeros(b) for b in sizes[1:]]
+    return NumpyMLP(weights, biases, classes=np.arange(n_classes))
+
+def run_micro(questions, scales, seed, bm25_backends):
+    from bm25 import BM25
+    from index_bundle import IndexBundle, INDEX_BUNDLE_DIR, kb_doc_text
+    from lemmatizer import FastPreprocessor, load_spacy, spacy_preprocess_batch
+
+    bundle = IndexBundle.load(INDEX_BUNDLE_DIR) if os.path.isdir(INDEX_BUNDLE_DIR) else IndexBundle.from_sources()
+    rng = random.Random(seed)
+    results = {"queries": len(questions), "kb_items": len(bundle.knowledge_base), "per_query": {}, "scales": {}}
+
+    per_query = results["per_query"]
+    if bundle.lemma_table is not None:
+        fast = FastPreprocessor(bundle.lemma_table, bundle.stopwords)
+        per_query["preprocess_text_fast"] = time_calls(fast.preprocess_text, questions)
+    nlp = load_spacy()
+    per_query["preprocess_text_spacy"] = time_calls(lambda q: spacy_preprocess_batch(nlp, [q], bundle.stopwords)[0], questions)
+    token_lists = spacy_preprocess_batch(nlp, questions, bundle.stopwords)
+    per_query["get_sentence_embedding"] = time_calls(bundle.embedder.embed, token_lists)
+    X = bundle.embedder.embed_batch(token_lists)
+    per_query["mlp_predict_proba"] = time_calls(lambda x: bundle.mlp.predict_proba(x[None, :]), list(X))
+
+    texts = [kb_doc_text(item) for item in bundle.knowledge_base]
+    for factor in scales:
+        docs = scaled_documents(texts, factor, rng)
+        scale = results["scales"][f"{factor}x"] = {"documents": len(docs)}
+        for backend in bm25_backends:
+            start = time.perf_counter()
+            bm25 = BM25(docs, backend=backend)
+            scale[f"bm25_{backend}"] = {"build_ms": round((time.perf_counter() - start) * 1000, 2),
+                                        **time_calls(bm25.get_scores, questions)}
+            del bm25
+        mlp = random_mlp(bundle.mlp, len(docs), rng)
+        scale["mlp_predict_proba"] = time_calls(lambda x: mlp.predict_proba(x[None, :]), list(X))
+        batches = [X[i:i + 32] for i in range(0, len(X), 32)]
+        scale["mlp_predict_proba_batch32"] = time_calls(mlp.predict_proba, batches)
+    results["peak_rss_mb"] = mb(peak_rss_bytes())
+    return results
+
+# Metadados para saber o que está sendo comparado
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'), "git_commit": commit,
+            "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "cpus": os.cpu_count()}
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Resultados salvos em {path}")
+
+# Comparação de dois resultados (ex.: antes e depois de uma mudança de desempenho)
+def flatten(data, prefix=''):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from flatten(value, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(data, list):
+        for i, value in enumerate(data):
+            # as execuções do replay são identificadas pela concorrência, não pela posição
+            label = f"c{value['concurrency']}" if isinstance(value, dict) and 'concurrency' in value else str(i)
+            yield from flatten(value, f"{prefix}.{label}")
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        yield prefix, data
+
+def compare(base, new, threshold):
+    """
+    Variação relativa de cada métrica presente nos dois arquivos; é regressão quando
+    piora mais que `threshold` (ex.: 0.1 = 10%).
+    """
+    base_values, new_values = dict(flatten(base)), dict(flatten(new))
+    rows, regressions = [], []
+    for key, old in base_values.items():
+        metric = key.rsplit('.', 1)[-1]
+        if metric not in LOWER_IS_BETTER + HIGHER_IS_BETTER or key not in new_values or not old:
+            continue
+        change = (new_values[key] - old) / old
+        worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+        rows.append((key, old, new_values[key], change, worse))
+        if worse:
+            regressions.append(key)
+    return rows, regressions
+
+# Main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def corpus_args(p):
+        p.add_argument('--corpus', help='JSON do corpus (gerado e salvo aqui se ainda não existir)')
+        p.add_argument('--size', type=int, default=CORPUS_SIZE, help='Perguntas no corpus')
+        p.add_argument('--seed', type=int, default=BENCH_SEED)
+        p.add_argument('--noise', type=float, default=NOISE_RATE, help='Fração das perguntas com ruído')
+
+    corpus = sub.add_parser('corpus', help='Gerar o corpus de perguntas')
+    corpus_args(corpus)
+    replay_parser = sub.add_parser('replay', help='Reenviar o corpus ao /query e medir latência e vazão')
+    corpus_args(replay_parser)
+    replay_parser.add_argument('--url', help='URL do backend (ex.: http://localhost:8000); sem ela, roda no próprio processo')
+    replay_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    replay_parser.add_argument('--warmup', type=int, default=20, help='Perguntas enviadas antes de medir')
+    replay_parser.add_argument('--top-k', type=int, default=3)
+    replay_parser.add_argument('--out', default='benchmark_replay.json')
+    micro = sub.add_parser('micro', help='Micro-benchmarks do pipeline sobre um KB sintético escalado')
+    corpus_args(micro)
+    micro.add_argument('--queries', type=int, default=MICRO_QUERIES, help='Perguntas do corpus usadas por medida')
+    micro.add_argument('--scales', type=int, nargs='+', default=list(SCALES))
+    micro.add_argument('--bm25-backends', nargs='+', default=['python', 'sparse'])
+    micro.add_argument('--out', default='benchmark_micro.json')
+    compare_parser = sub.add_parser('compare', help='Comparar dois resultados e apontar regressões')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='Piora relativa tolerada')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.base, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        with open(args.new, 'r', encoding='utf-8') as f:
+            new = json.load(f)
+        rows, regressions = compare(base, new, args.threshold)
+        for key, old, value, change, worse in rows:
+            print(f"{'!!' if worse else '  '} {key:<60} {old:>12.4g} -> {value:<12.4g} {change:+.1%}")
+        print(f"{len(regressions)} regressões acima de {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+    questions_corpus = load_corpus(args.corpus, args.size, args.seed, args.noise)
+    questions = [entry['question'] for entry in questions_corpus]
+    meta = {"environment": environment(), "args": vars(args)}
+    if args.command == 'corpus':
+        if not args.corpus:
+            print(json.dumps(questions_corpus, ensure_ascii=False, indent=2))
+    elif args.command == 'replay':
+        if args.url:
+            result = asyncio.run(replay_http(args.url, questions, args.concurrency, args.warmup, args.top_k))
+        else:
+            result = asyncio.run(replay_in_process(questions, args.concurrency, args.warmup, args.top_k))
+        save_results({"meta": meta, "replay": result}, args.out)
+        for run in result["runs"]:
+            print(f"concorrência {run['concurrency']:>3}: {run['throughput_rps']} req/s, "
+                  f"p50 {run.get('p50_ms')} ms, p95 {run.get('p95_ms')} ms, p99 {run.get('p99_ms')} ms, "
+                  f"status {run['statuses']}")
+    elif args.command == 'micro':
+        result = run_micro(questions[:args.queries], args.scales, args.seed, args.bm25_backends)
+        save_results({"meta": meta, "micro": result}, args.out)
@@ -1,54 +1,282 @@
-# bm25.py - Implementação simples de BM25Okapi (pura Python)
+# bm25.py - Implementação simples de BM25Okapi com índice invertido (pura Python)
+# e modo vetorizado opcional com matriz esparsa termo-documento (NumPy/SciPy)
+import copy
+import heapq
 import math
+import re
 from collections import Counter
 
+import numpy as np
+from scipy import sparse
+
 class BM25:
-    def __init__(self, documents, k1=1.5, b=0.75):
+    def __init__(self, documents, k1=1.5, b=0.75, backend='python', updatable=True):
         """
-        documents: lista de strings (textos)
+        documents: iterável de strings (textos), consumido uma única vez; pode ser um
+                   gerador, o índice guarda só as postings e não os textos
+        backend: 'python' (postings em dicts) ou 'sparse' (matriz CSR com pesos BM25)
+        updatable: False não guarda o Counter de cada documento (só usado por add/update/
+                   remove_document): índices somente leitura de corpora grandes, como os guias
         """
-        self.docs = [self._tokenize(d) for d in documents]
-        self.N = len(self.docs)
-        self.avgdl = sum(len(d) for d in self.docs) / self.N if self.N > 0 else 0.0
+        if backend not in ('python', 'sparse'):
+            raise ValueError(f"backend inválido: {backend}")
+        self.backend = backend
         self.k1 = k1
         self.b = b
 
-        # document frequency por termo
-        self.df = {}
-        for d in self.docs:
-            for term in set(d):
-                self.df[term] = self.df.get(term, 0) + 1
+        # frequências por documento (Counter) e índice invertido: termo -> lista de (doc_id, tf)
+        self.doc_lens = []
+        self.freqs = [] if updatable else None
+        self.postings = {}
+        for idx, text in enumerate(documents):
+            freqs = Counter(self._tokenize(text))
+            if updatable:
+                self.freqs.append(freqs)
+            self.doc_lens.append(sum(freqs.values()))
+            for term, tf in freqs.items():
+                self.postings.setdefault(term, []).append((idx, tf))
+        self.N = len(self.doc_lens)
+
+        # document frequency por termo; idf (suavizado) e normalização de comprimento em _refresh
+        self.df = {term: len(postings) for term, postings in self.postings.items()}
+        self.removed = set()
+        self._refresh()
+
+    def to_arrays(self):
+        """
+        Exporta o índice como arrays simples (postings em formato CSR termo -> documentos),
+        para ser salvo no bundle de índices e recarregado sem re-tokenizar o corpus.
+        """
+        terms = list(self.postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(self.postings[t]) for t in terms])
+        indices = np.fromiter((idx for t in terms for idx, _ in self.postings[t]), dtype=np.int32, count=int(indptr[-1]))
+        data = np.fromiter((tf for t in terms for _, tf in self.postings[t]), dtype=np.int32, count=int(indptr[-1]))
+        return {
+            'terms': terms,
+            'indptr': indptr,
+            'indices': indices,
+            'data': data,
+            'doc_lens': np.asarray(self.doc_lens, dtype=np.int32),
+            'idf': np.asarray([self.idf[t] for t in terms], dtype=np.float64),
+            'params': np.asarray([self.k1, self.b], dtype=np.float64),
+        }
+
+    @classmethod
+    def from_arrays(cls, terms, indptr, indices, data, doc_lens, idf, params, backend='python', updatable=True):
+        if backend not in ('python', 'sparse'):
+            raise ValueError(f"backend inválido: {backend}")
+        self = cls.__new__(cls)
+        self.backend = backend
+        self.k1, self.b = (float(p) for p in params)
+        self.doc_lens = np.asarray(doc_lens).tolist()
+        self.N = len(self.doc_lens)
+        self.avgdl = sum(self.doc_lens) / self.N if self.N > 0 else 0.0
+
+        indptr = np.asarray(indptr).tolist()
+        indices = np.asarray(indices).tolist()
+        data = np.asarray(data).tolist()
+        self.postings = {}
+        self.freqs = [Counter() for _ in range(self.N)] if updatable else None
+        for t, term in enumerate(terms):
+            postings = list(zip(indices[indptr[t]:indptr[t + 1]], data[indptr[t]:indptr[t + 1]]))
+            self.postings[term] = postings
+            if updatable:
+                for idx, tf in postings:
+                    self.freqs[idx][term] = tf
+        self.df = {term: len(postings) for term, postings in self.postings.items()}
+        self.idf = dict(zip(terms, np.asarray(idf).tolist()))
+        self.doc_norm = [self._length_norm(n) for n in self.doc_lens]
+        self.removed = set()
+
+        self.vocab = None
+        self.matrix = None
+        if backend == 'sparse':
+            self._build_matrix()
+        return self
+
+    def _refresh(self):
+        # recalcula o que depende do número de documentos: idf, avgdl e a normalização
+        # de comprimento k1 * (1 - b + b * |d| / avgdl); não re-tokeniza nada
+        n = self.N - len(self.removed)
+        self.avgdl = sum(self.doc_lens) / n if n > 0 else 0.0
+        self.idf = {term: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for term, freq in self.df.items()}
+        self.doc_norm = [self._length_norm(dl) for dl in self.doc_lens]
+        self.vocab = None
+        self.matrix = None
+        if self.backend == 'sparse':
+            self._build_matrix()
+
+    def copy(self):
+        # cópia independente (postings e contadores próprios) para atualizações copy-on-write
+        other = copy.copy(self)
+        other.postings = {term: list(postings) for term, postings in self.postings.items()}
+        other.freqs = list(self.freqs) if self.freqs is not None else None
+        other.doc_lens = list(self.doc_lens)
+        other.df = dict(self.df)
+        other.removed = set(self.removed)
+        return other
+
+    def _require_updatable(self):
+        if self.freqs is None:
+            raise ValueError("índice BM25 somente leitura (criado com updatable=False)")
+
+    def _index_document(self, idx, text):
+        freqs = Counter(self._tokenize(text))
+        self.freqs[idx] = freqs
+        self.doc_lens[idx] = sum(freqs.values())
+        for term, tf in freqs.items():
+            self.postings.setdefault(term, []).append((idx, tf))
+            self.df[term] = self.df.get(term, 0) + 1
+
+    def _unindex_document(self, idx):
+        for term in self.freqs[idx]:
+            postings = [p for p in self.postings[term] if p[0] != idx]
+            if postings:
+                self.postings[term] = postings
+                self.df[term] -= 1
+            else:
+                del self.postings[term]
+                del self.df[term]
+        self.freqs[idx] = Counter()
+        self.doc_lens[idx] = 0
 
-        # idf por termo (suavizado)
-        self.idf = {}
-        for term, freq in self.df.items():
-            self.idf[term] = math.log(1 + (self.N - freq + 0.5) / (freq + 0.5))
+    def add_document(self, text):
+        # novo documento no fim (doc_id = N); df, idf e avgdl são atualizados sem reconstruir o índice
+        self._require_updatable()
+        idx = self.N
+        self.freqs.append(Counter())
+        self.doc_lens.append(0)
+        self.N += 1
+        self._index_document(idx, text)
+        self._refresh()
+        return idx
 
-        # frequências por documento (Counter)
-        self.freqs = [Counter(d) for d in self.docs]
+    def update_document(self, idx, text):
+        self._require_updatable()
+        self._unindex_document(idx)
+        self._index_document(idx, text)
+        self.removed.discard(idx)
+        self._refresh()
+
+    def remove_document(self, idx):
+        # o slot fica vazio (sem postings, fora do N efetivo): os doc_ids dos demais não mudam
+        self._require_updatable()
+        self._unindex_document(idx)
+        self.removed.add(idx)
+        self._refresh()
+
+    def _build_matrix(self):
+        # matriz termo-documento (V x N) com o peso BM25 já calculado em cada célula:
+        # idf * tf * (k1 + 1) / (tf + norm_d); o score vira um produto esparso
+        self.vocab = {term: t for t, term in enumerate(self.postings)}
+        k1_plus_1 = self.k1 + 1
+        rows, cols, vals = [], [], []
+        for term, postings in self.postings.items():
+            t = self.vocab[term]
+            idf = self.idf[term]
+            for idx, tf in postings:
+                rows.append(t)
+                cols.append(idx)
+                vals.append(idf * tf * k1_plus_1 / (tf + self.doc_norm[idx]))
+        self.matrix = sparse.csr_matrix(
+            (np.asarray(vals, dtype=np.float64), (rows, cols)),
+            shape=(len(self.vocab), self.N),
+        )
+
+    def _query_matrix(self, queries):
+        # uma linha por consulta com a contagem de cada termo conhecido
+        rows, cols, vals = [], [], []
+        for r, query in enumerate(queries):
+            for term, qtf in Counter(self._tokenize(query)).items():
+                t = self.vocab.get(term)
+                if t is not None:
+                    rows.append(r)
+                    cols.append(t)
+                    vals.append(qtf)
+        return sparse.csr_matrix(
+            (np.asarray(vals, dtype=np.float64), (rows, cols)),
+            shape=(len(queries), len(self.vocab)),
+        )
+
+    def _sparse_scores(self, queries):
+        if self.matrix is None:
+            self._build_matrix()
+        return (self._query_matrix(queries) @ self.matrix).tocsr()
+
+    @staticmethod
+    def _top_n_from_row(indices, data, n):
+        if len(data) > n:
+            part = np.argpartition(-data, n - 1)[:n]
+            indices, data = indices[part], data[part]
+        # score decrescente, empate pelo menor doc_id
+        order = np.lexsort((indices, -data))
+        return [(int(indices[i]), float(data[i])) for i in order]
+
+    def _length_norm(self, doc_len):
+        if self.avgdl == 0:
+            return self.k1
+        return self.k1 * (1 - self.b + self.b * doc_len / self.avgdl)
 
     def _tokenize(self, text):
-        import re
         # normalização simples (mantém letras acentuadas)
         s = text.lower()
         s = re.sub(r'[^0-9a-zA-ZÀ-ÿ\s]', ' ', s)
         tokens = re.sub(r'\s+', ' ', s).strip().split(' ')
         return [t for t in tokens if len(t) > 0]
 
+    def _accumulate(self, query):
+        # term-at-a-time: percorre só as postings dos termos da consulta,
+        # tocando apenas os documentos que contêm algum deles
+        acc = {}
+        k1_plus_1 = self.k1 + 1
+        for term, qtf in Counter(self._tokenize(query)).items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term] * qtf
+            for idx, tf in postings:
+                acc[idx] = acc.get(idx, 0.0) + idf * tf * k1_plus_1 / (tf + self.doc_norm[idx])
+        return acc
+
+    def get_top_n(self, query, n):
+        """
+        Retorna até n pares (doc_id, score) em ordem decrescente de score,
+        considerando apenas documentos com pelo menos um termo da consulta.
+        Usa um heap de tamanho n em vez de ordenar todos os scores.
+        """
+        if self.backend == 'sparse':
+            row = self._sparse_scores([query])
+            return self._top_n_from_row(row.indices, row.data, n)
+        acc = self._accumulate(query)
+        # empate resolvido pelo menor doc_id (mesma ordem do sort estável)
+        top = heapq.nlargest(n, acc.items(), key=lambda x: (x[1], -x[0]))
+        return [(idx, score) for idx, score in top]
+
     def get_scores(self, query, top_n=None):
-        q_terms = self._tokenize(query)
-        scores = [0.0 for _ in range(self.N)]
-        for idx in range(self.N):
-            doc_len = len(self.docs[idx])
-            for term in q_terms:
-                if term not in self.freqs[idx]:
-                    continue
-                tf = self.freqs[idx][term]
-                idf = self.idf.get(term, 0.0)
-                denom = tf + self.k1 * (1 - self.b + self.b * doc_len / self.avgdl)
-                score = idf * tf * (self.k1 + 1) / denom
-                scores[idx] += score
         if top_n:
-            ranked = sorted(range(self.N), key=lambda i: scores[i], reverse=True)[:top_n]
-            return [(i, scores[i]) for i in ranked]
+            return self.get_top_n(query, top_n)
+        if self.backend == 'sparse':
+            return list(enumerate(self._sparse_scores([query]).toarray()[0].tolist()))
+        scores = [0.0] * self.N
+        for idx, score in self._accumulate(query).items():
+            scores[idx] = score
         return list(enumerate(scores))
+
+    def get_scores_batch(self, queries, top_n=None):
+        """
+        Pontua várias consultas com um único produto esparso (Q x V) @ (V x N).
+        Sem top_n retorna um np.ndarray (len(queries) x N); com top_n retorna,
+        para cada consulta, a lista de (doc_id, score) como em get_top_n.
+        """
+        scores = self._sparse_scores(queries)
+        if not top_n:
+            return scores.toarray()
+        return [
+            self._top_n_from_row(
+                scores.indices[scores.indptr[r]:scores.indptr[r + 1]],
+                scores.data[scores.indptr[r]:scores.indptr[r + 1]],
+                top_n,
+            )
+            for r in range(len(queries))
+        ]
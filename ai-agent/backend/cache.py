@@ -0,0 +1,100 @@
+# cache.py - Cache LRU com TTL para respostas do /query
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+def normalize_question(text):
+    # mesma pergunta com caixa, espaços ou pontuação final diferentes -> mesma chave
+    s = unicodedata.normalize('NFC', text).lower().strip()
+    s = re.sub(r'\s+', ' ', s)
+    return s.strip(' ?!.,;:')
+
+def files_fingerprint(paths):
+    # (mtime, tamanho) de cada arquivo; muda quando KB ou modelos são substituídos
+    fingerprint = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            fingerprint.append((path, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            fingerprint.append((path, None, None))
+    return tuple(fingerprint)
+
+class ResponseCache:
+    def __init__(self, maxsize=1024, ttl=3600.0, watch_files=(), check_interval=5.0):
+        """
+        maxsize: número máximo de entradas (0 desativa o cache)
+        ttl: validade de cada entrada em segundos
+        watch_files: arquivos cuja alteração invalida todo o cache
+        check_interval: intervalo mínimo em segundos entre verificações dos arquivos
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.watch_files = tuple(watch_files)
+        self.check_interval = check_interval
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = files_fingerprint(self.watch_files)
+        self._next_check = time.monotonic() + check_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_files(self, now):
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        fingerprint = files_fingerprint(self.watch_files)
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._data.clear()
+            self.invalidations += 1
+
+    def get(self, key):
+        if self.maxsize <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._check_files(now)
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
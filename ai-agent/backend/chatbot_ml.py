@@ -2,23 +2,35 @@
 # Implementação melhorada do Chatbot Cuidar+ Idosos com Word2Vec, MLPClassifier e integração com BM25/TF-IDF
 
 import json
+import os
 import re
+import copy
+import inspect
+import time
 import argparse
 import numpy as np
 import pandas as pd
 from collections import defaultdict
+import sklearn
 from sklearn.neural_network import MLPClassifier
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
-from gensim.models import Word2Vec
+from gensim.models import Word2Vec, KeyedVectors
 from gensim.utils import simple_preprocess
 import nltk
 from nltk.corpus import stopwords
 import spacy
 from bm25 import BM25
+from mlp_numpy import export_mlp, NumpyMLP
+from embeddings import SentenceEmbedder
+from lemmatizer import FastPreprocessor, build_lemma_table, save_lemma_table, agreement_stats, spacy_preprocess_batch, LEMMA_TABLE_FILE
+from index_bundle import build_index, file_sha256
+from passages import GUIDE_FILE
+from train_cache import StageCache, content_hash
+from tuning import load_tuning, TUNING_FILE
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from retrieval import HybridRetriever, BM25Ranker, TfidfRanker
 
 # Baixar recursos NLTK
 nltk.download('stopwords', quiet=True)
@@ -27,14 +39,21 @@ nltk.download('punkt_tab', quiet=True)
 
 # Configurações
 STOPWORDS = set(stopwords.words('portuguese')) - {'cuidador', 'idoso', 'saúde'}  # Manter palavras relevantes
-WORD2VEC_SIZE = 100
-WORD2VEC_WINDOW = 5
-WORD2VEC_MIN_COUNT = 2  # Ignorar palavras muito raras
-MLP_HIDDEN_LAYERS = (200, 100)
+# Parâmetros de treino e limiar: padrões de tuning.py, sobrescritos pelo tuning.json do sweep.py
+TUNING = load_tuning(os.getenv('TUNING_FILE', TUNING_FILE))
+WORD2VEC_SIZE = TUNING['training']['word2vec_size']
+WORD2VEC_WINDOW = TUNING['training']['word2vec_window']
+WORD2VEC_MIN_COUNT = TUNING['training']['word2vec_min_count']  # Ignorar palavras muito raras
+MLP_HIDDEN_LAYERS = tuple(TUNING['training']['mlp_hidden_layers'])
 MLP_MAX_ITER = 1000
 MODEL_FILE = 'mlp_intent_classifier_improved.npy'
+MLP_ARRAYS_FILE = 'mlp_intent_classifier_improved.npz'  # pesos em arrays simples para o backend
 W2V_MODEL_FILE = 'word2vec_model_improved.bin'
-CONFIDENCE_THRESHOLD = 0.6  # Limiar de confiança para usar MLP
+W2V_VECTORS_FILE = 'word2vec_vectors_improved.kv'  # só os vetores, para o backend (mmap)
+QUANTIZATION_REPORT_FILE = 'quantization_report.json'
+CONFIDENCE_THRESHOLD = TUNING['runtime']['confidence_threshold']  # Limiar de confiança para usar MLP
+TRAIN_N_PROCESS = min(4, os.cpu_count() or 1)  # processos do nlp.pipe no treino
+PIPE_PARALLEL_MIN_TEXTS = 2000  # abaixo disso, subir processos custa mais que o ganho
 
 # Carregar SpaCy para lematização
 nlp = spacy.load('pt_core_news_sm', disable=['parser', 'ner'])
@@ -47,19 +66,23 @@ ID_TO_CONTENT = {item['id']: item for item in KNOWLEDGE_BASE}
 # Preparar documentos para BM25/TF-IDF
 DOC_TEXTS = [(str(item['id']), item['topic'] + ' ' + item['content'] + ' ' + ' '.join(item.get('keywords', []))) for item in KNOWLEDGE_BASE]
 DOC_STRS = [t for (_, t) in DOC_TEXTS]
-bm25 = BM25(DOC_STRS)
+bm25 = BM25(DOC_STRS, backend='sparse')  # matriz esparsa: avaliação em lote
 vectorizer = TfidfVectorizer(lowercase=True)
 X_tfidf = vectorizer.fit_transform(DOC_STRS)
 
-# Carregar corpus para Word2Vec
+# Carregar corpus para Word2Vec (frases do guia + frases do knowledge base)
+def tokenize_sentences(text):
+    return [simple_preprocess(sent) for sent in nltk.sent_tokenize(text, language='portuguese')]
+
+def load_guide_sentences():
+    with open(GUIDE_FILE, 'r', encoding='utf-8') as f:
+        return tokenize_sentences(f.read())
+
+def load_kb_sentences():
+    return tokenize_sentences(' '.join(DOC_STRS))
+
 def load_corpus():
-    with open('guia_cuidador.txt', 'r', encoding='utf-8') as f:
-        guia_text = f.read()
-    kb_texts = [item['topic'] + ' ' + item['content'] + ' ' + ' '.join(item.get('keywords', [])) for item in KNOWLEDGE_BASE]
-    full_text = guia_text + ' ' + ' '.join(kb_texts)
-    sentences = nltk.sent_tokenize(full_text, language='portuguese')
-    tokenized_sentences = [simple_preprocess(sent) for sent in sentences]
-    return tokenized_sentences
+    return load_guide_sentences() + load_kb_sentences()
 
 # Pré-processamento com lematização
 def preprocess_text(text):
@@ -69,8 +92,7 @@ def preprocess_text(text):
 
 # Gerar embedding médio
 def get_sentence_embedding(tokens, w2v_model):
-    vectors = [w2v_model.wv[token] for token in tokens if token in w2v_model.wv]
-    return np.mean(vectors, axis=0) if vectors else np.zeros(WORD2VEC_SIZE)
+    return SentenceEmbedder(w2v_model.wv).embed(tokens)
 
 # Gerar dados sintéticos mais robustos
 # No arquivo chatbot_ml.py
@@ -139,20 +161,80 @@ def generate_synthetic_data():
     
     return data, labels
 
-# Treinar modelos
-def train_models():
-    print("Carregando corpus e treinando Word2Vec...")
-    corpus = load_corpus()
-    w2v_model = Word2Vec(sentences=corpus, vector_size=WORD2VEC_SIZE, window=WORD2VEC_WINDOW, min_count=WORD2VEC_MIN_COUNT, workers=4)
-    w2v_model.save(W2V_MODEL_FILE)
-    
-    print("Gerando dados sintéticos...")
-    data, labels = generate_synthetic_data()
-    
-    # Pré-processar e gerar embeddings
-    processed_data = [preprocess_text(text) for text in data]
-    X = np.array([get_sentence_embedding(tokens, w2v_model) for tokens in processed_data])
-    
+# Avaliar o BM25 em lote: fração das perguntas cujo melhor documento é a intenção correta
+def evaluate_fallback(queries, labels):
+    top = bm25.get_scores_batch(queries, top_n=1)
+    hits = sum(1 for ranked, label in zip(top, labels) if ranked and KNOWLEDGE_BASE[ranked[0][0]]['id'] == label)
+    return hits / len(labels) if labels else 0.0
+
+# Pré-processar os textos do treino: só os que ainda não estão no memo do cache passam pelo
+# spaCy, com nlp.pipe em n_process processos quando o lote é grande
+def preprocess_texts(texts, cache, n_process=TRAIN_N_PROCESS, memo_name='tokens'):
+    key = content_hash(nlp.meta['name'], nlp.meta['version'], sorted(STOPWORDS))
+    memo = cache.memo(memo_name, key)
+    missing = list(dict.fromkeys(t for t in texts if t not in memo))
+    if missing:
+        n = n_process if len(missing) >= PIPE_PARALLEL_MIN_TEXTS else 1
+        memo.update(zip(missing, spacy_preprocess_batch(nlp, missing, STOPWORDS, n_process=n)))
+    # só as frases atuais ficam no memo (frases removidas do KB não acumulam)
+    if missing or len(memo) != len(set(texts)):
+        cache.save_memo(memo_name, key, {t: memo[t] for t in texts})
+    return [memo[t] for t in texts]
+
+def compute_features(data, w2v_model, cache, n_process=TRAIN_N_PROCESS):
+    tokens = preprocess_texts(data, cache, n_process)
+    return SentenceEmbedder(w2v_model.wv).embed_batch(tokens), tokens
+
+def train_word2vec(sentences, size=WORD2VEC_SIZE, window=WORD2VEC_WINDOW, min_count=WORD2VEC_MIN_COUNT):
+    return Word2Vec(sentences=sentences, vector_size=size, window=window, min_count=min_count, workers=4)
+
+def update_word2vec(base, sentences):
+    # continua o treino de um modelo já treinado com frases novas (vocabulário ampliado)
+    model = copy.deepcopy(base)
+    model.build_vocab(sentences, update=True)
+    model.train(sentences, total_examples=len(sentences), epochs=model.epochs)
+    return model
+
+def _save_json(name):
+    def save(data, directory):
+        with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+    return save
+
+def _load_json(name):
+    def load(directory):
+        with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return load
+
+def _save_w2v(model, directory):
+    model.save(os.path.join(directory, 'word2vec.model'))
+
+def _load_w2v(directory):
+    return Word2Vec.load(os.path.join(directory, 'word2vec.model'))
+
+def _save_features(features, directory):
+    X, tokens = features
+    np.save(os.path.join(directory, 'X.npy'), X)
+    _save_json('tokens.json')(tokens, directory)
+
+def _load_features(directory):
+    return np.load(os.path.join(directory, 'X.npy')), _load_json('tokens.json')(directory)
+
+def _save_mlp(result, directory):
+    models, report = result
+    np.save(os.path.join(directory, 'mlp.npy'), np.array(models, dtype=object))
+    _save_json('report.json')(report, directory)
+
+def _load_mlp(directory):
+    models = np.load(os.path.join(directory, 'mlp.npy'), allow_pickle=True)
+    return tuple(models), _load_json('report.json')(directory)
+
+def split_indices(labels):
+    # mesma divisão treino/teste no treino e na avaliação do sweep.py
+    return train_test_split(np.arange(len(labels)), test_size=0.2, random_state=42, stratify=labels)
+
+def fit_mlp(X, labels, hidden_layers=MLP_HIDDEN_LAYERS):
     # Normalizar embeddings
     scaler = StandardScaler()
     X = scaler.fit_transform(X)
@@ -162,53 +244,228 @@ def train_models():
     y = le.fit_transform(labels)
     
     # Dividir em train/test
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    train_idx, test_idx = split_indices(labels)
+    X_train, X_test, y_train, y_test = X[train_idx], X[test_idx], y[train_idx], y[test_idx]
     
     print("Treinando MLPClassifier...")
-    mlp = MLPClassifier(hidden_layer_sizes=MLP_HIDDEN_LAYERS, max_iter=MLP_MAX_ITER, early_stopping=True, random_state=42)
+    mlp = MLPClassifier(hidden_layer_sizes=tuple(hidden_layers), max_iter=MLP_MAX_ITER, early_stopping=True, random_state=42)
     mlp.fit(X_train, y_train)
     
     # Avaliar
     y_pred = mlp.predict(X_test)
+    return (mlp, le, scaler), classification_report(y_test, y_pred, zero_division=0)
+
+# Etapas do treino, cada uma com cache endereçado pelo conteúdo (train_cache.py).
+# Retornam a chave junto com o resultado: a chave entra na das etapas seguintes.
+def corpus_stage(cache):
+    guide_key = content_hash(file_sha256(GUIDE_FILE), inspect.getsource(tokenize_sentences))
+    guide_sentences = cache.run('guide_tokens', guide_key, load_guide_sentences,
+                                _save_json('sentences.json'), _load_json('sentences.json'))
+    return guide_key, guide_sentences, load_kb_sentences()
+
+def word2vec_stage(cache, corpus, size=WORD2VEC_SIZE, window=WORD2VEC_WINDOW, min_count=WORD2VEC_MIN_COUNT,
+                   incremental=False):
+    guide_key, guide_sentences, kb_sentences = corpus
+    params = [size, window, min_count]
+    if incremental:
+        base_key = content_hash('word2vec_guide', guide_key, params)
+        base = cache.run('word2vec_guide', base_key, lambda: train_word2vec(guide_sentences, *params), _save_w2v, _load_w2v)
+        key = content_hash('word2vec_update', base_key, kb_sentences)
+        return key, cache.run('word2vec', key, lambda: update_word2vec(base, kb_sentences), _save_w2v, _load_w2v)
+    key = content_hash('word2vec', guide_key, kb_sentences, params)
+    return key, cache.run('word2vec', key, lambda: train_word2vec(guide_sentences + kb_sentences, *params),
+                          _save_w2v, _load_w2v)
+
+def synthetic_stage(cache):
+    key = content_hash(KNOWLEDGE_BASE, inspect.getsource(generate_synthetic_data))
+    data, labels = cache.run('synthetic', key, generate_synthetic_data, _save_json('data.json'), _load_json('data.json'))
+    return key, data, labels
+
+def features_stage(cache, synthetic, w2v, n_process=TRAIN_N_PROCESS):
+    synthetic_key, data, _ = synthetic
+    w2v_key, w2v_model = w2v
+    key = content_hash(synthetic_key, w2v_key, sorted(STOPWORDS), nlp.meta['name'], nlp.meta['version'])
+    X, tokens = cache.run('features', key, lambda: compute_features(data, w2v_model, cache, n_process),
+                          _save_features, _load_features)
+    return key, X, tokens
+
+def mlp_stage(cache, features_key, X, labels, hidden_layers=MLP_HIDDEN_LAYERS):
+    key = content_hash(features_key, labels, list(hidden_layers), MLP_MAX_ITER, sklearn.__version__)
+    models, report = cache.run('mlp', key, lambda: fit_mlp(X, labels, hidden_layers), _save_mlp, _load_mlp)
+    return key, models, report
+
+# Treinar modelos em etapas com cache endereçado pelo conteúdo (train_cache.py):
+# corpus do guia -> Word2Vec -> dados sintéticos -> features -> MLP. Cada etapa só roda
+# de novo se as suas entradas (arquivos, parâmetros, código ou etapas anteriores) mudaram.
+def train_models(use_cache=True, n_process=TRAIN_N_PROCESS, incremental_w2v=False, quantize=False):
+    """
+    use_cache: False recalcula todas as etapas
+    quantize: bundle com vetores float16 e MLP int8, mais o relatório de paridade
+    n_process: processos do nlp.pipe no pré-processamento dos dados sintéticos e na tabela de lemas
+    incremental_w2v: o Word2Vec do guia fica em cache e só continua o treino com as frases
+                     do knowledge base (uma edição no KB não retreina o Word2Vec do zero;
+                     os vetores diferem um pouco dos de um treino completo)
+    """
+    cache = StageCache(enabled=use_cache)
+
+    print("Carregando corpus e treinando Word2Vec...")
+    corpus = corpus_stage(cache)
+    w2v_key, w2v_model = w2v = word2vec_stage(cache, corpus, incremental=incremental_w2v)
+    w2v_model.save(W2V_MODEL_FILE)
+    export_vectors(w2v_model)
+
+    lemma_key = content_hash(corpus[0], DOC_STRS, w2v_key, nlp.meta['name'], nlp.meta['version'])
+    lemma_table = cache.run('lemma_table', lemma_key, lambda: compute_lemma_table(w2v_model, n_process),
+                            _save_json('lemmas.json'), _load_json('lemmas.json'))
+    save_lemma_table(lemma_table, LEMMA_TABLE_FILE)
+    
+    print("Gerando dados sintéticos...")
+    synthetic = synthetic_stage(cache)
+    _, data, labels = synthetic
+    
+    # Pré-processar e gerar embeddings
+    features_key, X, processed_data = features_stage(cache, synthetic, w2v, n_process)
+
+    # Concordância do pré-processamento rápido (tabela de lemas) com o spaCy
+    fast = FastPreprocessor(lemma_table, STOPWORDS, nlp_loader=lambda: nlp)
+    agreement = agreement_stats(data, fast, lambda texts: processed_data)
+    print(f"Pré-processamento rápido vs spaCy: {agreement['exact_match']:.2%} das frases idênticas, "
+          f"{agreement['token_agreement']:.2%} dos tokens")
+
+    _, (mlp, le, scaler), report = mlp_stage(cache, features_key, X, labels)
     print("Relatório de Classificação:")
-    print(classification_report(y_test, y_pred, zero_division=0))
+    print(report)
+
+    # Avaliar o fallback BM25 sobre todas as perguntas sintéticas (um único produto esparso)
+    print(f"Acurácia top-1 do fallback BM25: {evaluate_fallback(data, labels):.2%}")
     
     # Salvar modelos
     np.save(MODEL_FILE, [mlp, le, scaler, w2v_model.wv.key_to_index])
+    export_mlp(MLP_ARRAYS_FILE, mlp, le, scaler)
+    build_index(quantize=quantize)
+    if quantize:
+        report_quantization(cache)
+    for stage, info in cache.report.items():
+        print(f"  {stage:<15} {'cache' if info['status'] == 'cache' else 'executada':<10} {info['seconds']:>8.2f} s")
     print("Modelos treinados e salvos!")
 
+# Salvar só os KeyedVectors, com a matriz de vetores em um .npy separado para
+# que o backend possa abri-la com mmap='r' (sem syn1neg e estado de treino)
+def export_vectors(w2v_model):
+    w2v_model.wv.save(W2V_VECTORS_FILE, separately=['vectors'])
+
+# Tabela forma -> lema (KB, guia e vocabulário do Word2Vec) para o pré-processamento rápido do backend
+def compute_lemma_table(w2v_model, n_process=1):
+    with open(GUIDE_FILE, 'r', encoding='utf-8') as f:
+        guide_lines = [line for line in f.read().splitlines() if line.strip()]
+    return build_lemma_table(DOC_STRS + guide_lines, nlp, extra_words=w2v_model.wv.index_to_key, n_process=n_process)
+
+def export_lemma_table(w2v_model):
+    table = compute_lemma_table(w2v_model)
+    save_lemma_table(table, LEMMA_TABLE_FILE)
+    return table
+
+# Exportar os modelos já treinados para os formatos usados pelo backend
+def export_models(quantize=False):
+    w2v_model = Word2Vec.load(W2V_MODEL_FILE)
+    export_vectors(w2v_model)
+    export_lemma_table(w2v_model)
+    mlp, le, scaler, vocab = np.load(MODEL_FILE, allow_pickle=True)
+    export_mlp(MLP_ARRAYS_FILE, mlp, le, scaler)
+    build_index(quantize=quantize)
+    print(f"Modelos exportados para {W2V_VECTORS_FILE}, {LEMMA_TABLE_FILE} e {MLP_ARRAYS_FILE}")
+    if quantize:
+        report_quantization(StageCache())
+
+# Paridade do modelo quantizado (vetores float16 + MLP int8) com o float, nas perguntas
+# sintéticas de teste (fora do treino do MLP): acurácia, concordância e tamanhos
+def quantization_parity(cache, threshold=CONFIDENCE_THRESHOLD):
+    _, data, labels = synthetic_stage(cache)
+    _, test_idx = split_indices(labels)
+    tokens = preprocess_texts(data, cache)
+    tokens = [tokens[i] for i in test_idx]
+    y = np.asarray([labels[i] for i in test_idx])
+
+    wv = KeyedVectors.load(W2V_VECTORS_FILE, mmap='r')
+    model = NumpyMLP.load(MLP_ARRAYS_FILE)
+    quantized = model.quantized()
+    variants = {
+        'float': (SentenceEmbedder(wv), model,
+                  sum(np.asarray(W).nbytes for W in model.weights)),
+        'quantized': (SentenceEmbedder.from_arrays(wv.index_to_key, np.asarray(wv.vectors, dtype=np.float16)), quantized,
+                      sum(W.nbytes + scale.nbytes for W, scale in zip(quantized.weights, quantized.scales))),
+    }
+    report = {"test_questions": len(y), "confidence_threshold": threshold}
+    outputs = {}
+    for name, (embedder, mlp, weights_bytes) in variants.items():
+        X = embedder.embed_batch(tokens)
+        probs = mlp.predict_proba(X)
+        seconds = []
+        for row in X:
+            start = time.perf_counter()
+            mlp.predict_proba(row[None, :])
+            seconds.append(time.perf_counter() - start)
+        best = probs.argmax(axis=1)
+        confidence = probs[np.arange(len(best)), best]
+        predicted = mlp.classes[best]
+        outputs[name] = (probs, predicted, confidence > threshold)
+        report[name] = {
+            "accuracy": float((predicted == y).mean()),
+            "routing_rate": float((confidence > threshold).mean()),
+            "vectors_bytes": int(np.asarray(embedder.vectors).nbytes),
+            "mlp_weights_bytes_on_disk": int(weights_bytes),
+            "forward_ms": round(float(np.mean(seconds) * 1000), 4),
+        }
+    (p_float, pred_float, routed_float), (p_quant, pred_quant, routed_quant) = outputs['float'], outputs['quantized']
+    report["top1_agreement"] = float((pred_float == pred_quant).mean())
+    report["routing_agreement"] = float((routed_float == routed_quant).mean())
+    report["max_abs_prob_diff"] = float(np.abs(p_float - p_quant).max())
+    report["mean_abs_prob_diff"] = float(np.abs(p_float - p_quant).mean())
+    return report
+
+def report_quantization(cache):
+    report = quantization_parity(cache)
+    with open(QUANTIZATION_REPORT_FILE, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Paridade float vs quantizado ({report['test_questions']} perguntas de teste): acurácia "
+          f"{report['float']['accuracy']:.2%} -> {report['quantized']['accuracy']:.2%}, "
+          f"top-1 igual em {report['top1_agreement']:.2%}, roteamento igual em {report['routing_agreement']:.2%}, "
+          f"vetores {report['float']['vectors_bytes']} -> {report['quantized']['vectors_bytes']} bytes, "
+          f"pesos do MLP {report['float']['mlp_weights_bytes_on_disk']} -> {report['quantized']['mlp_weights_bytes_on_disk']} bytes "
+          f"(relatório em {QUANTIZATION_REPORT_FILE})")
+    return report
+
 # Carregar modelos
 def load_models():
     w2v_model = Word2Vec.load(W2V_MODEL_FILE)
     mlp, le, scaler, vocab = np.load(MODEL_FILE, allow_pickle=True)
     return w2v_model, mlp, le, scaler
 
-# Fallback com BM25/TF-IDF
+# Fallback com BM25/TF-IDF: rankings fundidos por RRF (mesmos limiares do app.py)
+retriever = HybridRetriever(
+    {'bm25': (BM25Ranker(bm25), 1.0), 'tfidf': (TfidfRanker(vectorizer, X_tfidf), 1.0)},
+    method='rrf', min_scores={'bm25': TUNING['runtime']['fallback_min_bm25'], 'tfidf': TUNING['runtime']['fallback_min_tfidf']},
+)
+
 def fallback_search(query, top_k=3):
-    scores = bm25.get_scores(query)
-    ranked = sorted(scores, key=lambda x: x[1], reverse=True)[:top_k]
-    
-    q_vec = vectorizer.transform([query])
-    sims = cosine_similarity(q_vec, X_tfidf)[0]
-    ranked_tfidf = sims.argsort()[::-1][:top_k]
-    
-    # Combinar resultados (usar BM25 como primário, TF-IDF para complementar)
+    # "score" é o BM25 bruto, como no app.py; o valor da fusão vai em "fused_score"
     results = []
-    seen_ids = set()
-    for idx, score in ranked:
-        if len(results) >= top_k:
-            break
-        item = KNOWLEDGE_BASE[idx]
-        if item['id'] not in seen_ids:
-            results.append({
-                'id': item['id'],
-                'topic': item['topic'],
-                'module': item.get('module'),
-                'content': item['content'],
-                'score': float(score)
-            })
-            seen_ids.add(item['id'])
-    
+    bm25_scores = None
+    for hit in retriever.search(query, top_k):
+        item = KNOWLEDGE_BASE[hit['index']]
+        bm25_score = hit['scores'].get('bm25')
+        if bm25_score is None:
+            if bm25_scores is None:
+                bm25_scores = bm25.get_scores(query)
+            bm25_score = bm25_scores[hit['index']][1]
+        results.append({
+            'id': item['id'],
+            'topic': item['topic'],
+            'module': item.get('module'),
+            'content': item['content'],
+            'score': float(bm25_score),
+            'fused_score': float(hit['score'])
+        })
     return results
 
 # Inferir intenção e responder
@@ -255,10 +512,20 @@ def interactive_mode():
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--train', action='store_true', help='Treinar os modelos')
+    parser.add_argument('--export', action='store_true', help='Exportar os modelos treinados para os formatos do backend (.kv/.npz/tabela de lemas)')
+    parser.add_argument('--no-cache', action='store_true', help='Recalcular todas as etapas do treino, ignorando o cache')
+    parser.add_argument('--n-process', type=int, default=TRAIN_N_PROCESS, help='Processos do spaCy (nlp.pipe) no treino')
+    parser.add_argument('--incremental-w2v', action='store_true',
+                        help='Reaproveitar o Word2Vec do guia e só continuar o treino com as frases do knowledge base')
+    parser.add_argument('--quantize', action='store_true',
+                        help='Com --train/--export: bundle com vetores float16 e MLP int8 + relatório de paridade')
     args = parser.parse_args()
     
     if args.train:
-        train_models()
+        train_models(use_cache=not args.no_cache, n_process=args.n_process, incremental_w2v=args.incremental_w2v,
+                     quantize=args.quantize)
+    elif args.export:
+        export_models(quantize=args.quantize)
     else:
         try:
             interactive_mode()
@@ -0,0 +1,62 @@
+# embeddings.py - Embedding médio de frases sobre os vetores Word2Vec (KeyedVectors)
+# Os tokens viram ids numa única passada pelo dicionário e a média sai de um
+# único fancy-indexing na matriz de vetores; em lote usa np.add.reduceat.
+import numpy as np
+
+def _accumulator(vectors):
+    # vetores float16 (bundle quantizado) são somados e devolvidos em float32
+    return np.result_type(vectors.dtype, np.float32)
+
+class SentenceEmbedder:
+    def __init__(self, wv):
+        """
+        wv: KeyedVectors (ou w2v_model.wv) já treinados; a matriz pode estar mapeada em memória
+        """
+        self.key_to_index = wv.key_to_index
+        self.vectors = wv.vectors
+        self.vector_size = wv.vector_size
+        self.dtype = _accumulator(self.vectors)
+
+    @classmethod
+    def from_arrays(cls, index_to_key, vectors):
+        # mesma interface a partir da lista de palavras e da matriz (ex.: bundle de índices)
+        self = cls.__new__(cls)
+        self.key_to_index = {key: i for i, key in enumerate(index_to_key)}
+        self.vectors = vectors
+        self.vector_size = vectors.shape[1]
+        self.dtype = _accumulator(vectors)
+        return self
+
+    def token_ids(self, tokens):
+        # tokens fora do vocabulário são descartados, como antes
+        return [i for i in map(self.key_to_index.get, tokens) if i is not None]
+
+    def embed(self, tokens):
+        ids = self.token_ids(tokens)
+        if not ids:
+            return np.zeros(self.vector_size, dtype=self.dtype)
+        return self.vectors[ids].mean(axis=0, dtype=self.dtype)
+
+    def embed_batch(self, token_lists, out=None):
+        """
+        Gera a matriz (len(token_lists) x vector_size) de embeddings médios.
+        out: matriz pré-alocada opcional, preenchida no lugar.
+        """
+        n = len(token_lists)
+        if out is None:
+            out = np.zeros((n, self.vector_size), dtype=self.dtype)
+        else:
+            out[:] = 0
+
+        ids_per_row = [self.token_ids(tokens) for tokens in token_lists]
+        counts = np.fromiter((len(ids) for ids in ids_per_row), dtype=np.intp, count=n)
+        rows = np.flatnonzero(counts)
+        if len(rows) == 0:
+            return out
+
+        flat_ids = np.fromiter((i for ids in ids_per_row for i in ids), dtype=np.intp, count=int(counts.sum()))
+        # início de cada segmento não vazio no vetor achatado de ids
+        offsets = np.concatenate(([0], np.cumsum(counts[rows])[:-1]))
+        sums = np.add.reduceat(self.vectors[flat_ids], offsets, axis=0, dtype=self.dtype)
+        out[rows] = sums / counts[rows, None]
+        return out
@@ -0,0 +1,17 @@
+# gunicorn.conf.py - Launcher de produção do backend: vários workers uvicorn com os
+# modelos pré-carregados. Uso: gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# O app (bundle de índices, vetores, MLP) é importado uma vez no master e herdado pelos
+# workers no fork: as páginas são compartilhadas (copy-on-write) e os arrays mapeados
+# do bundle ficam no page cache uma única vez. Threads (pool de inferência, micro-batcher)
+# são criadas em cada worker no primeiro uso.
+preload_app = True
+
+timeout = int(os.getenv('WORKER_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
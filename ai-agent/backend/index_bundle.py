@@ -0,0 +1,292 @@
+# index_bundle.py - Bundle versionado com todos os artefatos derivados usados pelo backend
+# (knowledge base e mapas de id, índice BM25, matriz/vocabulário TF-IDF, vetores Word2Vec,
+# embeddings densos dos itens, trechos do guia, pesos do MLP, stopwords e tabela de lemas).
+# Gerado uma vez com `build-index`; o app carrega tudo do disco sem chamadas de rede e sem
+# refazer fit/tokenização.
+#
+# Uso: python index_bundle.py build-index [--out index_bundle] [--guides guia_cuidador.txt ...] [--quantize]
+#      (--kb/--model/--vectors/--lemmas/--language/--spacy-model geram o bundle de outro guia; ver kb_registry.py)
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+
+from bm25 import BM25
+from embeddings import SentenceEmbedder
+from lemmatizer import FastPreprocessor, SPACY_MODEL, load_spacy, spacy_preprocess_batch
+from mlp_numpy import NumpyMLP, export_quantized_mlp
+from passages import GUIDE_FILE, PassageIndex
+from retrieval import DenseIndex
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FORMAT_VERSION = 4
+INDEX_BUNDLE_DIR = 'index_bundle'
+KB_FILE = 'knowledge_base.json'
+MODEL_FILE = 'mlp_intent_classifier_improved.npz'
+W2V_VECTORS_FILE = 'word2vec_vectors_improved.kv'
+LEMMA_TABLE_FILE = 'lemma_table.json'
+STOPWORDS_LANGUAGE = 'portuguese'
+KEEP_STOPWORDS = {'cuidador', 'idoso', 'saúde'}
+
+def kb_doc_text(item):
+    # texto indexado de cada item (BM25/TF-IDF)
+    return item['topic'] + ' ' + item['content'] + ' ' + ' '.join(item.get('keywords', []))
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+@contextmanager
+def phase(timings, name):
+    # mede uma fase da inicialização (em ms) e registra no log
+    start = time.perf_counter()
+    yield
+    elapsed = (time.perf_counter() - start) * 1000
+    if timings is not None:
+        timings[name] = round(elapsed, 2)
+    logger.info("startup: %s em %.1f ms", name, elapsed)
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+def _load_stopwords(language=STOPWORDS_LANGUAGE):
+    import nltk
+    nltk.download('stopwords', quiet=True)
+    return set(nltk.corpus.stopwords.words(language)) - KEEP_STOPWORDS
+
+def _preprocess_docs(texts, lemma_table, stopwords, spacy_model=SPACY_MODEL):
+    # mesmo pré-processamento das perguntas (tabela de lemas ou spaCy completo)
+    if lemma_table is not None:
+        return FastPreprocessor(lemma_table, stopwords, nlp_loader=lambda: load_spacy(spacy_model)).preprocess_batch(texts)
+    return spacy_preprocess_batch(load_spacy(spacy_model), texts, stopwords)
+
+class IndexBundle:
+    def __init__(self, knowledge_base, stopwords, bm25, vectorizer, X_tfidf, tfidf_counts, embedder, mlp,
+                 dense_matrix, dense_mean, passage_index=None, lemma_table=None, manifest=None, model_file=None):
+        self.knowledge_base = knowledge_base
+        self.id_to_content = {item['id']: item for item in knowledge_base}
+        self.doc_strs = [kb_doc_text(item) for item in knowledge_base]
+        self.stopwords = stopwords
+        self.bm25 = bm25
+        self.vectorizer = vectorizer
+        self.X_tfidf = X_tfidf
+        self.tfidf_counts = tfidf_counts  # contagens brutas (itens x termos), base das atualizações incrementais
+        self.embedder = embedder
+        self.mlp = mlp
+        # embeddings (tópico + conteúdo + keywords) centralizados e normalizados, um por item
+        self.dense_matrix = dense_matrix
+        self.dense_mean = dense_mean
+        self.passage_index = passage_index  # trechos dos guias indexados no BM25 (None sem guias)
+        self.lemma_table = lemma_table
+        self.manifest = manifest or {}
+        self.model_file = model_file
+
+    @classmethod
+    def from_sources(cls, kb_file=KB_FILE, model_file=MODEL_FILE, vectors_file=W2V_VECTORS_FILE,
+                     lemma_file=LEMMA_TABLE_FILE, guide_files=(GUIDE_FILE,), bm25_backend='python', timings=None,
+                     language=STOPWORDS_LANGUAGE, spacy_model=SPACY_MODEL):
+        """
+        Constrói o bundle em memória a partir dos arquivos de origem (o caminho antigo do app).
+        language: idioma das stopwords do NLTK; spacy_model: modelo usado para as palavras fora
+        da tabela de lemas (os dois ficam no manifest e valem também no app)
+        """
+        from gensim.models import KeyedVectors
+
+        with phase(timings, 'knowledge_base'):
+            knowledge_base = _read_json(kb_file)
+            doc_strs = [kb_doc_text(item) for item in knowledge_base]
+        with phase(timings, 'stopwords'):
+            stopwords = _load_stopwords(language)
+        with phase(timings, 'bm25'):
+            bm25 = BM25(doc_strs, backend=bm25_backend)
+        with phase(timings, 'tfidf'):
+            vectorizer = TfidfVectorizer(lowercase=True)
+            X_tfidf = vectorizer.fit_transform(doc_strs)
+            tfidf_counts = CountVectorizer(vocabulary=vectorizer.vocabulary_).transform(doc_strs)
+        with phase(timings, 'vectors'):
+            embedder = SentenceEmbedder(KeyedVectors.load(vectors_file, mmap='r'))
+        with phase(timings, 'mlp'):
+            mlp = NumpyMLP.load(model_file)
+        with phase(timings, 'lemma_table'):
+            lemma_table = _read_json(lemma_file)['lemmas'] if os.path.exists(lemma_file) else None
+        with phase(timings, 'dense'):
+            dense_matrix, dense_mean = DenseIndex.prepare(
+                embedder.embed_batch(_preprocess_docs(doc_strs, lemma_table, stopwords, spacy_model)))
+        with phase(timings, 'passages'):
+            guide_files = [p for p in guide_files if os.path.exists(p)]
+            passage_index = PassageIndex.build(guide_files, bm25_backend=bm25_backend) if guide_files else None
+
+        sources = [kb_file, model_file, vectors_file, vectors_file + '.vectors.npy'] + guide_files
+        if lemma_table is not None:
+            sources.append(lemma_file)
+        manifest = {
+            'format_version': BUNDLE_FORMAT_VERSION,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'items': len(knowledge_base),
+            'passages': len(passage_index) if passage_index is not None else 0,
+            'language': language,
+            'spacy_model': spacy_model,
+            'sources': {path: file_sha256(path) for path in sources},
+        }
+        return cls(knowledge_base, stopwords, bm25, vectorizer, X_tfidf, tfidf_counts, embedder, mlp,
+                   dense_matrix, dense_mean, passage_index=passage_index, lemma_table=lemma_table,
+                   manifest=manifest, model_file=model_file)
+
+    def save(self, path=INDEX_BUNDLE_DIR, quantize=False):
+        """
+        quantize: grava os vetores Word2Vec em float16 e os pesos do MLP em int8 com uma escala
+                  por unidade de saída (o load reconhece os dois formatos)
+        """
+        # grava num diretório temporário e troca de uma vez, para nunca deixar um bundle pela metade
+        tmp = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        _write_json(os.path.join(tmp, 'knowledge_base.json'), self.knowledge_base)
+        _write_json(os.path.join(tmp, 'stopwords.json'), sorted(self.stopwords))
+
+        bm25_arrays = self.bm25.to_arrays()
+        _write_json(os.path.join(tmp, 'bm25_terms.json'), bm25_arrays.pop('terms'))
+        np.savez(os.path.join(tmp, 'bm25.npz'), **bm25_arrays)
+
+        X = self.X_tfidf.tocsr()
+        np.savez(os.path.join(tmp, 'tfidf.npz'), data=X.data, indices=X.indices, indptr=X.indptr,
+                 shape=np.asarray(X.shape), idf=self.vectorizer.idf_)
+        C = self.tfidf_counts.tocsr()
+        np.savez(os.path.join(tmp, 'tfidf_counts.npz'), data=C.data, indices=C.indices, indptr=C.indptr,
+                 shape=np.asarray(C.shape))
+        _write_json(os.path.join(tmp, 'tfidf_vocabulary.json'),
+                    {term: int(i) for term, i in self.vectorizer.vocabulary_.items()})
+
+        keys = sorted(self.embedder.key_to_index, key=self.embedder.key_to_index.get)
+        _write_json(os.path.join(tmp, 'vocab.json'), keys)
+        vectors = np.asarray(self.embedder.vectors)
+        np.save(os.path.join(tmp, 'vectors.npy'), vectors.astype(np.float16) if quantize else vectors)
+
+        np.save(os.path.join(tmp, 'dense.npy'), np.asarray(self.dense_matrix))
+        np.save(os.path.join(tmp, 'dense_mean.npy'), np.asarray(self.dense_mean))
+
+        if self.passage_index is not None:
+            self.passage_index.save_passages(os.path.join(tmp, 'passages.jsonl'))
+            passage_arrays = self.passage_index.bm25.to_arrays()
+            _write_json(os.path.join(tmp, 'passages_bm25_terms.json'), passage_arrays.pop('terms'))
+            np.savez(os.path.join(tmp, 'passages_bm25.npz'), **passage_arrays)
+
+        if quantize:
+            export_quantized_mlp(os.path.join(tmp, 'mlp.npz'), self.mlp)
+        else:
+            # regravado (e não copiado): um .npz antigo, com o scaler separado, sai já dobrado
+            self.mlp.save(os.path.join(tmp, 'mlp.npz'))
+        if self.lemma_table is not None:
+            _write_json(os.path.join(tmp, 'lemma_table.json'), self.lemma_table)
+        self.manifest['quantization'] = {'vectors': 'float16', 'mlp': 'int8'} if quantize else None
+        _write_json(os.path.join(tmp, 'manifest.json'), self.manifest)
+
+        old = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old)
+        os.rename(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path=INDEX_BUNDLE_DIR, bm25_backend='python', timings=None):
+        with phase(timings, 'manifest'):
+            manifest = _read_json(os.path.join(path, 'manifest.json'))
+            if manifest.get('format_version') != BUNDLE_FORMAT_VERSION:
+                raise ValueError(f"{path}: versão de bundle {manifest.get('format_version')} "
+                                 f"incompatível (esperada {BUNDLE_FORMAT_VERSION}); rode build-index")
+        with phase(timings, 'knowledge_base'):
+            knowledge_base = _read_json(os.path.join(path, 'knowledge_base.json'))
+            stopwords = set(_read_json(os.path.join(path, 'stopwords.json')))
+        with phase(timings, 'bm25'):
+            with np.load(os.path.join(path, 'bm25.npz')) as arrays:
+                bm25 = BM25.from_arrays(_read_json(os.path.join(path, 'bm25_terms.json')),
+                                        backend=bm25_backend, **arrays)
+        with phase(timings, 'tfidf'):
+            with np.load(os.path.join(path, 'tfidf.npz')) as arrays:
+                X_tfidf = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                            shape=tuple(arrays['shape']))
+                vectorizer = TfidfVectorizer(lowercase=True)
+                vectorizer.vocabulary_ = _read_json(os.path.join(path, 'tfidf_vocabulary.json'))
+                vectorizer.idf_ = arrays['idf']
+            with np.load(os.path.join(path, 'tfidf_counts.npz')) as arrays:
+                tfidf_counts = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                                 shape=tuple(arrays['shape']))
+        with phase(timings, 'vectors'):
+            embedder = SentenceEmbedder.from_arrays(_read_json(os.path.join(path, 'vocab.json')),
+                                                    np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r'))
+        with phase(timings, 'dense'):
+            dense_matrix = np.load(os.path.join(path, 'dense.npy'), mmap_mode='r')
+            dense_mean = np.load(os.path.join(path, 'dense_mean.npy'))
+        with phase(timings, 'passages'):
+            passage_index = None
+            if os.path.exists(os.path.join(path, 'passages.jsonl')):
+                with np.load(os.path.join(path, 'passages_bm25.npz')) as arrays:
+                    passage_bm25 = BM25.from_arrays(_read_json(os.path.join(path, 'passages_bm25_terms.json')),
+                                                    backend=bm25_backend, updatable=False, **arrays)
+                passage_index = PassageIndex.load(os.path.join(path, 'passages.jsonl'), passage_bm25)
+        with phase(timings, 'mlp'):
+            model_file = os.path.join(path, 'mlp.npz')
+            mlp = NumpyMLP.load(model_file)
+        with phase(timings, 'lemma_table'):
+            lemma_file = os.path.join(path, 'lemma_table.json')
+            lemma_table = _read_json(lemma_file) if os.path.exists(lemma_file) else None
+
+        return cls(knowledge_base, stopwords, bm25, vectorizer, X_tfidf, tfidf_counts, embedder, mlp,
+                   dense_matrix, dense_mean, passage_index=passage_index, lemma_table=lemma_table,
+                   manifest=manifest, model_file=model_file)
+
+    def stale_sources(self):
+        # arquivos de origem que mudaram desde o build (o bundle deve ser regerado)
+        stale = []
+        for source, digest in self.manifest.get('sources', {}).items():
+            if os.path.exists(source) and file_sha256(source) != digest:
+                stale.append(source)
+        return stale
+
+def build_index(out=INDEX_BUNDLE_DIR, guide_files=(GUIDE_FILE,), quantize=False, **sources):
+    # sources: kb_file, model_file, vectors_file, lemma_file, language, spacy_model (padrões do guia principal)
+    timings = {}
+    bundle = IndexBundle.from_sources(guide_files=guide_files, timings=timings, **sources)
+    bundle.save(out, quantize=quantize)
+    print(f"Bundle de índices ({bundle.manifest['items']} itens, {bundle.manifest['passages']} trechos"
+          f"{', quantizado' if quantize else ''}) salvo em {out}: {timings}")
+
+# Main
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build-index', help='Pré-computar todos os artefatos de serving em um bundle')
+    build.add_argument('--out', default=INDEX_BUNDLE_DIR, help='Diretório do bundle')
+    build.add_argument('--guides', nargs='+', default=[GUIDE_FILE], help='Guias em texto cortados em trechos')
+    build.add_argument('--quantize', action='store_true', help='Vetores em float16 e MLP em int8 (ver chatbot_ml.py --quantize)')
+    build.add_argument('--kb', default=KB_FILE, help='Knowledge base (JSON)')
+    build.add_argument('--model', default=MODEL_FILE, help='Pesos do MLP exportados (.npz)')
+    build.add_argument('--vectors', default=W2V_VECTORS_FILE, help='Vetores Word2Vec (KeyedVectors)')
+    build.add_argument('--lemmas', default=LEMMA_TABLE_FILE, help='Tabela de lemas (opcional)')
+    build.add_argument('--language', default=STOPWORDS_LANGUAGE, help='Idioma das stopwords do NLTK')
+    build.add_argument('--spacy-model', default=SPACY_MODEL, help='Modelo spaCy do idioma')
+    args = parser.parse_args()
+
+    if args.command == 'build-index':
+        build_index(args.out, args.guides, args.quantize, kb_file=args.kb, model_file=args.model,
+                    vectors_file=args.vectors, lemma_file=args.lemmas, language=args.language,
+                    spacy_model=args.spacy_model)
@@ -0,0 +1,206 @@
+# kb_index.py - Knowledge base atualizável com o servidor no ar (API /kb/items)
+# Cada alteração monta um novo snapshot (BM25, TF-IDF, embeddings densos e mapas de id)
+# a partir do atual, sem refazer fit nem re-tokenizar os outros itens, e troca a
+# referência de uma vez: uma requisição em andamento continua vendo o snapshot antigo.
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from cache import files_fingerprint
+from index_bundle import kb_doc_text
+from kb_store import KBStore
+from retrieval import DenseIndex
+
+class TfidfIndex:
+    def __init__(self, vocabulary, counts, n_docs):
+        """
+        vocabulary: dict termo -> coluna (cresce com termos novos, nunca encolhe)
+        counts: matriz CSR de contagens (itens x termos); itens removidos ficam com a linha vazia
+        n_docs: número de itens válidos
+        Os pesos seguem o TfidfVectorizer padrão: idf suavizado ln((1 + n) / (1 + df)) + 1 e norma L2.
+        """
+        self.vocabulary = vocabulary
+        self.counts = counts.tocsr()
+        self.n_docs = n_docs
+        self.df = np.bincount(self.counts.indices, minlength=len(vocabulary))
+        self.idf = np.log((1 + n_docs) / (1 + self.df)) + 1
+        self.X = normalize(sparse.csr_matrix(self.counts.multiply(self.idf)))
+
+        self.vectorizer = TfidfVectorizer(lowercase=True)
+        self.vectorizer.vocabulary_ = vocabulary
+        self.vectorizer.idf_ = self.idf
+
+    def with_rows(self, rows, n_docs):
+        """
+        Novo índice com as linhas trocadas; rows: dict linha -> texto (None = linha vazia).
+        Só os textos alterados passam pelo analisador; df/idf vêm das contagens.
+        """
+        analyzer = self.vectorizer.build_analyzer()
+        vocabulary = dict(self.vocabulary)
+        coo = self.counts.tocoo()
+        keep = ~np.isin(coo.row, list(rows))
+        r, c, v = [coo.row[keep]], [coo.col[keep]], [coo.data[keep]]
+        for idx, text in rows.items():
+            if text is None:
+                continue
+            counts = Counter(analyzer(text))
+            r.append(np.full(len(counts), idx))
+            c.append(np.fromiter((vocabulary.setdefault(term, len(vocabulary)) for term in counts), dtype=np.intp, count=len(counts)))
+            v.append(np.fromiter(counts.values(), dtype=coo.data.dtype, count=len(counts)))
+        n_rows = max(self.counts.shape[0], max(rows, default=-1) + 1)
+        counts = sparse.csr_matrix((np.concatenate(v), (np.concatenate(r), np.concatenate(c))),
+                                   shape=(n_rows, len(vocabulary)))
+        return TfidfIndex(vocabulary, counts, n_docs)
+
+class KBSnapshot:
+    def __init__(self, items, bm25, tfidf, dense_matrix, version=0, store=None):
+        """
+        items: itens do knowledge base na ordem dos índices; None marca um item removido
+               (os índices dos demais não mudam até o próximo build-index)
+        store: KBStore com as mesmas linhas (None monta a partir de items)
+        """
+        self.items = items
+        self.store = store if store is not None else KBStore.from_items(items)
+        self.bm25 = bm25
+        self.tfidf = tfidf
+        self.dense_matrix = dense_matrix
+        self.version = version
+        self.id_to_index = {item['id']: i for i, item in enumerate(items) if item is not None}
+        self.id_to_content = {item['id']: item for item in items if item is not None}
+        self.retriever = None
+        self.router = None
+
+    @property
+    def knowledge_base(self):
+        return [item for item in self.items if item is not None]
+
+class KBIndex:
+    def __init__(self, knowledge_base, bm25, vectorizer, tfidf_counts, dense_matrix, dense_mean,
+                 embed_docs, make_retriever, make_router=None, kb_file=None, check_interval=5.0):
+        """
+        embed_docs: função lista de textos -> embeddings médios (mesmo pré-processamento das perguntas)
+        make_retriever: função snapshot -> HybridRetriever sobre os índices do snapshot
+        make_router: função snapshot -> KeywordRouter sobre os itens do snapshot (None desativa)
+        kb_file: knowledge_base.json regravado a cada alteração (None não persiste)
+        check_interval: intervalo mínimo em segundos entre verificações do kb_file (check_due/maybe_sync)
+        """
+        self.dense_mean = dense_mean
+        self.embed_docs = embed_docs
+        self.make_retriever = make_retriever
+        self.make_router = make_router
+        self.kb_file = kb_file
+        self.check_interval = check_interval
+        self._fingerprint = files_fingerprint([kb_file]) if kb_file else None
+        self._next_check = time.monotonic() + check_interval
+        self._lock = threading.Lock()
+        tfidf = TfidfIndex(dict(vectorizer.vocabulary_), tfidf_counts, len(knowledge_base))
+        self.snapshot = self._finish(KBSnapshot(list(knowledge_base), bm25, tfidf, dense_matrix))
+
+    def _finish(self, snapshot):
+        snapshot.retriever = self.make_retriever(snapshot)
+        if self.make_router is not None:
+            snapshot.router = self.make_router(snapshot)
+        return snapshot
+
+    def add(self, item):
+        with self._lock:
+            if item['id'] in self.snapshot.id_to_index:
+                raise ValueError(f"item {item['id']} já existe")
+            self._commit(len(self.snapshot.items), item)
+        return item
+
+    def update(self, item):
+        with self._lock:
+            idx = self.snapshot.id_to_index.get(item['id'])
+            if idx is None:
+                raise KeyError(item['id'])
+            self._commit(idx, item)
+        return item
+
+    def delete(self, item_id):
+        with self._lock:
+            idx = self.snapshot.id_to_index.get(item_id)
+            if idx is None:
+                raise KeyError(item_id)
+            self._commit(idx, None)
+
+    def check_due(self):
+        # sem I/O (pode rodar no event loop): True no máximo uma vez a cada check_interval
+        now = time.monotonic()
+        if not self.kb_file or now < self._next_check:
+            return False
+        self._next_check = now + self.check_interval
+        return True
+
+    def sync_if_changed(self):
+        # um stat; só relê o arquivo (e refaz os índices dos itens alterados) se ele mudou
+        if files_fingerprint([self.kb_file]) != self._fingerprint:
+            self.sync()
+
+    def maybe_sync(self):
+        if self.check_due():
+            self.sync_if_changed()
+
+    def sync(self, force=False):
+        """
+        Aplica as alterações feitas no kb_file por outro processo (ex.: outro worker
+        que recebeu a chamada da API), item a item, como se viessem da própria API.
+        force: compara os itens mesmo sem mudança no arquivo desde a criação do índice
+               (ex.: KB carregado de um bundle anterior às edições gravadas no kb_file)
+        """
+        with self._lock:
+            fingerprint = files_fingerprint([self.kb_file])
+            if fingerprint == self._fingerprint and not force:
+                return
+            with open(self.kb_file, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+            current = self.snapshot.id_to_content
+            for item in items:
+                if item['id'] not in current:
+                    self._commit(len(self.snapshot.items), item, persist=False)
+                elif item != current[item['id']]:
+                    self._commit(self.snapshot.id_to_index[item['id']], item, persist=False)
+            for item_id in set(current) - {item['id'] for item in items}:
+                self._commit(self.snapshot.id_to_index[item_id], None, persist=False)
+            self._fingerprint = fingerprint
+
+    def _commit(self, idx, item, persist=True):
+        # monta o próximo snapshot a partir do atual (copy-on-write) e troca a referência
+        old = self.snapshot
+        items = list(old.items)
+        text = kb_doc_text(item) if item is not None else None
+        bm25 = old.bm25.copy()
+        dense = np.array(old.dense_matrix)
+        if idx == len(items):
+            items.append(item)
+            bm25.add_document(text)
+            dense = np.vstack([dense, DenseIndex.project(self.embed_docs([text]), self.dense_mean)])
+        elif item is None:
+            items[idx] = None
+            bm25.remove_document(idx)
+            dense[idx] = 0
+        else:
+            items[idx] = item
+            bm25.update_document(idx, text)
+            dense[idx] = DenseIndex.project(self.embed_docs([text]), self.dense_mean)[0]
+        n_docs = sum(1 for it in items if it is not None)
+        tfidf = old.tfidf.with_rows({idx: text}, n_docs)
+        store = old.store.with_row(idx, item)
+        self.snapshot = self._finish(KBSnapshot(items, bm25, tfidf, dense, old.version + 1, store))
+        if self.kb_file and persist:
+            self._persist(self.snapshot.knowledge_base)
+            self._fingerprint = files_fingerprint([self.kb_file])
+
+    def _persist(self, knowledge_base):
+        # grava num temporário e renomeia: quem lê o arquivo nunca vê um JSON pela metade
+        tmp = f"{self.kb_file}.tmp-{os.getpid()}"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(knowledge_base, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.kb_file)
@@ -0,0 +1,122 @@
+# kb_registry.py - Vários knowledge bases servidos pelo mesmo processo
+# Cada KB extra (kb_registry.json: kb_id -> bundle gerado por build-index) é carregado no
+# primeiro uso; requisições simultâneas para um KB ainda não carregado esperam a mesma carga.
+# Acima do orçamento de memória, os KBs usados há mais tempo são descarregados (LRU).
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+KB_REGISTRY_FILE = 'kb_registry.json'
+
+def load_registry(path=KB_REGISTRY_FILE):
+    # {"kb_id": {"bundle": "...", "kb_file": "...", "spacy_model": "..."}}; sem arquivo, só o KB padrão
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def directory_bytes(path):
+    # tamanho do bundle em disco: estimativa da memória que o KB ocupa depois de carregado
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+class KBRegistry:
+    def __init__(self, specs, loader, memory_budget, pinned=None):
+        """
+        specs: dict kb_id -> configuração do KB (repassada ao loader)
+        loader: função (kb_id, spec) -> KB servido, com o atributo memory_bytes
+        memory_budget: limite (bytes) da soma dos KBs carregados sob demanda
+        pinned: dict kb_id -> KB já carregado que nunca é descarregado (o KB padrão)
+        """
+        self.specs = dict(specs)
+        self.loader = loader
+        self.memory_budget = memory_budget
+        self.pinned = dict(pinned or {})
+        self._loaded = OrderedDict()  # kb_id -> KB, do usado há mais tempo para o mais recente
+        self._loading = {}  # kb_id -> Future da carga em andamento
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.load_errors = 0
+        self.evictions = 0
+
+    def __contains__(self, kb_id):
+        return kb_id in self.pinned or kb_id in self.specs
+
+    def peek(self, kb_id):
+        # o KB se já estiver em memória (conta como uso), senão None; nunca carrega
+        if kb_id in self.pinned:
+            return self.pinned[kb_id]
+        with self._lock:
+            served = self._loaded.get(kb_id)
+            if served is not None:
+                self._loaded.move_to_end(kb_id)
+                self.hits += 1
+            return served
+
+    def get(self, kb_id):
+        """KB servido, carregando no primeiro uso; KeyError se o kb_id não existe."""
+        served = self.peek(kb_id)
+        if served is not None:
+            return served
+        if kb_id not in self.specs:
+            raise KeyError(kb_id)
+        with self._lock:
+            served = self._loaded.get(kb_id)
+            if served is not None:
+                self._loaded.move_to_end(kb_id)
+                return served
+            future = self._loading.get(kb_id)
+            owner = future is None
+            if owner:
+                future = self._loading[kb_id] = Future()
+        if not owner:
+            # outra requisição já está carregando este KB: espera a mesma carga
+            return future.result()
+
+        try:
+            served = self.loader(kb_id, self.specs[kb_id])
+        except BaseException as e:
+            with self._lock:
+                del self._loading[kb_id]
+                self.load_errors += 1
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[kb_id]
+            self._loaded[kb_id] = served
+            self.loads += 1
+            self._evict(keep=kb_id)
+        logger.info("KB %s carregado (%.1f MB)", kb_id, served.memory_bytes / 2**20)
+        future.set_result(served)
+        return served
+
+    def _evict(self, keep):
+        # o KB recém-carregado fica, mesmo que sozinho passe do orçamento; requisições em
+        # andamento num KB descarregado terminam com ele (a memória sai quando elas acabam)
+        while self._loaded_bytes() > self.memory_budget:
+            victim = next((kb_id for kb_id in self._loaded if kb_id != keep), None)
+            if victim is None:
+                break
+            del self._loaded[victim]
+            self.evictions += 1
+            logger.info("KB %s descarregado (orçamento de memória)", victim)
+
+    def _loaded_bytes(self):
+        return sum(served.memory_bytes for served in self._loaded.values())
+
+    def stats(self):
+        with self._lock:
+            return {"available": sorted(set(self.pinned) | set(self.specs)), "pinned": sorted(self.pinned),
+                    "loaded": list(self._loaded), "loading": list(self._loading),
+                    "loaded_bytes": self._loaded_bytes(), "memory_budget_bytes": self.memory_budget,
+                    "hits": self.hits, "loads": self.loads, "load_errors": self.load_errors,
+                    "evictions": self.evictions}
@@ -0,0 +1,95 @@
+# kb_store.py - Itens do knowledge base em colunas, com o JSON de cada resposta pronto
+# Cada linha guarda topic/module internados e o fragmento '{"topic":..,"module":..,"content":..'
+# já codificado em bytes na carga. No caminho da resposta só os campos que mudam por
+# pergunta (confiança, scores, fonte) são codificados; o resto é concatenação de bytes.
+import sys
+
+import numpy as np
+import orjson
+
+DEFAULT_MODULE = 'Geral'
+MISSING_ID = -1  # id das linhas de itens removidos
+
+def _fragment(topic, module, content):
+    # objeto sem o '}' final: recebe os campos variáveis da resposta
+    return orjson.dumps({"topic": topic, "module": module, "content": content})[:-1]
+
+class Result:
+    __slots__ = ('source', 'json')
+
+    def __init__(self, source, json):
+        self.source = source
+        self.json = json  # bytes do objeto completo do resultado
+
+class KBStore:
+    def __init__(self, ids, topics, modules, contents, fragments):
+        """
+        Colunas na ordem dos índices do snapshot; uma linha removida fica com id MISSING_ID.
+        Use from_items para montar a partir da lista de itens.
+        """
+        self.ids = ids
+        self.topics = topics
+        self.modules = modules
+        self.contents = contents
+        self.fragments = fragments
+        self.row_of = {int(item_id): row for row, item_id in enumerate(ids.tolist()) if item_id != MISSING_ID}
+
+    @classmethod
+    def from_items(cls, items):
+        ids = np.full(len(items), MISSING_ID, dtype=np.int64)
+        topics, modules, contents, fragments = [], [], [], []
+        for row, item in enumerate(items):
+            topic, module, content, fragment = cls._columns(item)
+            if item is not None:
+                ids[row] = item['id']
+            topics.append(topic)
+            modules.append(module)
+            contents.append(content)
+            fragments.append(fragment)
+        return cls(ids, topics, modules, contents, fragments)
+
+    @staticmethod
+    def _columns(item):
+        if item is None:
+            return None, None, None, None
+        # poucos tópicos/módulos distintos, muitas respostas: uma cópia de cada string
+        topic = sys.intern(item['topic'])
+        module = sys.intern(item.get('module') or DEFAULT_MODULE)
+        return topic, module, item['content'], _fragment(topic, module, item['content'])
+
+    def with_row(self, row, item):
+        """Novo store com a linha trocada (row == len: acrescenta; item None: remove); só ela é codificada."""
+        ids = self.ids.copy()
+        topics, modules, contents, fragments = list(self.topics), list(self.modules), list(self.contents), list(self.fragments)
+        if row == len(ids):
+            ids = np.append(ids, MISSING_ID)
+            for column in (topics, modules, contents, fragments):
+                column.append(None)
+        ids[row] = item['id'] if item is not None else MISSING_ID
+        topics[row], modules[row], contents[row], fragments[row] = self._columns(item)
+        return KBStore(ids, topics, modules, contents, fragments)
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def result(self, row, source, **fields):
+        # fields: campos variáveis (confidence, score, scores), na ordem da resposta
+        fields['source'] = source
+        return Result(source, self.fragments[row] + b',' + orjson.dumps(fields)[1:])
+
+def static_result(source, **fields):
+    # resultado que não vem de um item (ex.: a resposta do System Fallback), codificado uma vez
+    fields['source'] = source
+    return Result(source, orjson.dumps(fields))
+
+def encode_response(question, response):
+    """Bytes de {"query", ["corrected_query"], "results", "passages"} com os resultados já codificados."""
+    parts = [b'{"query":', orjson.dumps(question)]
+    if 'corrected_query' in response:
+        parts += [b',"corrected_query":', orjson.dumps(response['corrected_query'])]
+    parts += [b',"results":[', b','.join(result.json for result in response['results']),
+              b'],"passages":', orjson.dumps(response['passages']), b'}']
+    return b''.join(parts)
+
+def encode_responses(questions, responses):
+    return b'{"responses":[' + b','.join(encode_response(q, r) for q, r in zip(questions, responses)) + b']}'
@@ -0,0 +1,122 @@
+# keyword_router.py - Atalho por palavra-chave antes do pipeline de ML
+# Um autômato Aho-Corasick sobre tópicos e keywords normalizados do knowledge base
+# encontra, numa passada pela pergunta, todos os termos conhecidos. Se a pergunta é só
+# esses termos (mais palavras de ligação como "o que é", "dicas para") e eles apontam
+# para um único item, a resposta sai sem spaCy, Word2Vec e MLP. Qualquer dúvida
+# (termo de vários itens, palavra desconhecida) cai no pipeline normal.
+import re
+import unicodedata
+from collections import deque
+
+# palavras das perguntas do tipo "O que é X?", "Dicas para X", "Cuidados com X em idosos"
+# (as mesmas dos modelos de frases sintéticas do treino), sem acento
+FILLER_WORDS = frozenset("""
+o a os as um uma e de do da dos das no na nos nas em para pra por com sobre ao aos
+que qual quais como quando onde porque me eu voce meu minha
+explique explica explicar fale falar diga dicas dica cuidados cuidado relacionados
+relacionado relacionada relacionadas lidar fazer prevenir ajudar significa informacoes
+informacao quero queria saber preciso gostaria idoso idosos idosa idosas pessoa pessoas
+""".split())
+
+def normalize(text):
+    # minúsculas, sem acento e só letras/dígitos separados por um espaço
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(re.findall(r'\w+', text))
+
+class AhoCorasick:
+    def __init__(self, patterns):
+        """
+        patterns: lista de strings; search devolve o índice de cada padrão encontrado
+        O autômato (transições, links de falha e saídas) é montado uma vez; a busca é
+        uma passada pelo texto, independente do número de padrões.
+        """
+        self.patterns = list(patterns)
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pid, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[state][ch] = nxt
+                state = nxt
+            self.out[state].append(pid)
+
+        # links de falha em largura: o maior sufixo próprio que também é prefixo de algum padrão
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def search(self, text):
+        # lista de (início, fim, índice do padrão), com sobreposições
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for pid in self.out[state]:
+                matches.append((i + 1 - len(self.patterns[pid]), i + 1, pid))
+        return matches
+
+class KeywordRouter:
+    def __init__(self, knowledge_base, stopwords=()):
+        """
+        knowledge_base: itens com 'id', 'topic' e 'keywords'
+        stopwords: ignoradas como as FILLER_WORDS quando sobram fora dos termos encontrados
+        """
+        targets = {}
+        for item in knowledge_base:
+            for term in [item.get('topic', '')] + list(item.get('keywords') or []):
+                term = normalize(term)
+                if term:
+                    targets.setdefault(term, set()).add(item['id'])
+        # espaços nas pontas: só casa palavras inteiras ("dor" não casa dentro de "cuidador")
+        self.terms = list(targets)
+        self.targets = [frozenset(targets[term]) for term in self.terms]
+        self.automaton = AhoCorasick(f" {term} " for term in self.terms)
+        self.ignored = FILLER_WORDS | {normalize(word) for word in stopwords}
+        # keywords que são só palavras de ligação ("idoso") não decidem o item quando há outros termos
+        self.weak = [all(word in self.ignored for word in term.split()) for term in self.terms]
+
+    def route(self, question):
+        """
+        (id do único item que a pergunta nomeia ou None, resultado); resultado é hit,
+        ambiguous (termos de itens diferentes), partial (sobram palavras desconhecidas)
+        ou miss (nenhum termo). Só hit dispensa o MLP.
+        """
+        text = f" {normalize(question)} "
+        matches = self.automaton.search(text)
+        if not matches:
+            return None, 'miss'
+        # termos contidos num termo maior encontrado não contam ("cuidador" dentro de "papel do cuidador")
+        matches = [m for m in matches
+                   if not any(o[0] <= m[0] and m[1] <= o[1] and (o[1] - o[0]) > (m[1] - m[0]) for o in matches)]
+        strong = [m for m in matches if not self.weak[m[2]]]
+
+        covered = bytearray(len(text))
+        candidates = None
+        for start, end, pid in matches:
+            covered[start:end] = b'\x01' * (end - start)
+        for start, end, pid in strong or matches:
+            candidates = self.targets[pid] if candidates is None else candidates & self.targets[pid]
+
+        for word in re.finditer(r'\S+', text):
+            if not covered[word.start()] and word.group() not in self.ignored:
+                return None, 'partial'
+        if len(candidates) != 1:
+            return None, 'ambiguous'
+        return next(iter(candidates)), 'hit'
@@ -0,0 +1,168 @@
+# lemmatizer.py - Pré-processamento rápido com tabela de lemas (forma -> lema)
+# A tabela é gerada com spaCy no treinamento a partir do knowledge base, do guia e
+# do vocabulário do Word2Vec; em produção basta um tokenizador por regex + dict.
+# Só tokens fora da tabela caem no spaCy (carregado sob demanda).
+import argparse
+import json
+import re
+import threading
+from collections import Counter, defaultdict
+
+LEMMA_TABLE_FILE = 'lemma_table.json'
+SPACY_MODEL = 'pt_core_news_sm'
+MAX_RUNTIME_LEMMAS = 50000  # limite de lemas aprendidos em produção via fallback
+
+TOKEN_RE = re.compile(r"\w+(?:-\w+)*")
+
+def load_spacy(model=SPACY_MODEL):
+    import spacy
+    return spacy.load(model, disable=['parser', 'ner'])
+
+def spacy_preprocess_batch(nlp, texts, stopwords, n_process=1, batch_size=1000):
+    # caminho spaCy completo (referência): lema de cada token que não é stopword e tem > 2 letras
+    # n_process > 1 divide o lote entre processos (vale a pena só para milhares de textos)
+    return [[token.lemma_ for token in doc if token.text not in stopwords and len(token.text) > 2]
+            for doc in nlp.pipe([t.lower() for t in texts], n_process=n_process, batch_size=batch_size)]
+
+def build_lemma_table(texts, nlp, extra_words=(), n_process=1):
+    """
+    texts: textos (KB, guia) processados com contexto; cada forma recebe o lema mais frequente
+    extra_words: palavras avulsas (ex.: vocabulário do Word2Vec) ainda não vistas nos textos
+    """
+    counts = defaultdict(Counter)
+    for doc in nlp.pipe((t.lower() for t in texts), n_process=n_process):
+        for token in doc:
+            if TOKEN_RE.fullmatch(token.text):
+                counts[token.text][token.lemma_] += 1
+
+    missing = [w.lower() for w in extra_words if w.lower() not in counts and TOKEN_RE.fullmatch(w.lower())]
+    for word, doc in zip(missing, nlp.pipe(missing, n_process=n_process)):
+        if len(doc) == 1:
+            counts[word][doc[0].lemma_] += 1
+
+    return {form: lemmas.most_common(1)[0][0] for form, lemmas in counts.items()}
+
+def save_lemma_table(table, path=LEMMA_TABLE_FILE):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"spacy_model": SPACY_MODEL, "lemmas": table}, f, ensure_ascii=False, sort_keys=True)
+
+def load_lemma_table(path=LEMMA_TABLE_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)["lemmas"]
+
+class FastPreprocessor:
+    def __init__(self, table, stopwords, nlp_loader=load_spacy):
+        """
+        table: dict forma -> lema
+        stopwords: conjunto de stopwords (filtradas pela forma, como no caminho spaCy)
+        nlp_loader: função que carrega o spaCy na primeira palavra fora da tabela
+        """
+        self.table = table
+        self.stopwords = stopwords
+        self.nlp_loader = nlp_loader
+        self._nlp = None
+        self._runtime = {}
+        self._lock = threading.Lock()
+        self.table_hits = 0
+        self.fallback_tokens = 0
+
+    def _lemmatize_unknown(self, words):
+        with self._lock:
+            if self._nlp is None:
+                self._nlp = self.nlp_loader()
+            nlp = self._nlp
+        lemmas = {}
+        for word, doc in zip(words, nlp.pipe(words)):
+            lemmas[word] = doc[0].lemma_ if len(doc) == 1 else word
+        with self._lock:
+            if len(self._runtime) < MAX_RUNTIME_LEMMAS:
+                self._runtime.update(lemmas)
+        return lemmas
+
+    def _forms(self, text):
+        return [w for w in TOKEN_RE.findall(text.lower()) if w not in self.stopwords and len(w) > 2]
+
+    def preprocess_batch(self, texts):
+        forms_per_text = [self._forms(t) for t in texts]
+
+        unknown = {w for forms in forms_per_text for w in forms if w not in self.table and w not in self._runtime}
+        fallback = self._lemmatize_unknown(sorted(unknown)) if unknown else {}
+
+        results = []
+        hits = misses = 0
+        for forms in forms_per_text:
+            tokens = []
+            for w in forms:
+                lemma = self.table.get(w)
+                if lemma is None:
+                    lemma = fallback.get(w) or self._runtime.get(w, w)
+                    misses += 1
+                else:
+                    hits += 1
+                tokens.append(lemma)
+            results.append(tokens)
+        with self._lock:
+            self.table_hits += hits
+            self.fallback_tokens += misses
+        return results
+
+    def preprocess_text(self, text):
+        return self.preprocess_batch([text])[0]
+
+    def stats(self):
+        total = self.table_hits + self.fallback_tokens
+        return {
+            "mode": "fast",
+            "table_size": len(self.table),
+            "table_hits": self.table_hits,
+            "fallback_tokens": self.fallback_tokens,
+            "hit_rate": self.table_hits / total if total else 0.0,
+            "spacy_loaded": self._nlp is not None,
+        }
+
+def agreement_stats(texts, fast, spacy_preprocess_batch):
+    """
+    Compara o caminho rápido com o spaCy completo: concordância por token
+    (posição a posição) e por texto (sequência idêntica).
+    """
+    fast_tokens = fast.preprocess_batch(texts)
+    spacy_tokens = spacy_preprocess_batch(texts)
+    same_tokens = total_tokens = exact = 0
+    for a, b in zip(fast_tokens, spacy_tokens):
+        exact += a == b
+        total_tokens += max(len(a), len(b))
+        same_tokens += sum(1 for x, y in zip(a, b) if x == y)
+    return {
+        "texts": len(texts),
+        "exact_match": exact / len(texts) if texts else 0.0,
+        "token_agreement": same_tokens / total_tokens if total_tokens else 1.0,
+    }
+
+# Main: gera a tabela a partir dos artefatos do backend e mede a concordância
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--build', action='store_true', help='Gerar lemma_table.json com spaCy')
+    parser.add_argument('--compare', action='store_true', help='Comparar o caminho rápido com o spaCy')
+    args = parser.parse_args()
+
+    import nltk
+    from gensim.models import KeyedVectors
+    nltk.download('stopwords', quiet=True)
+    stopwords = set(nltk.corpus.stopwords.words('portuguese')) - {'cuidador', 'idoso', 'saúde'}
+
+    with open('knowledge_base.json', 'r', encoding='utf-8') as f:
+        kb = json.load(f)
+    kb_texts = [item['topic'] + ' ' + item['content'] + ' ' + ' '.join(item.get('keywords', [])) for item in kb]
+    with open('guia_cuidador.txt', 'r', encoding='utf-8') as f:
+        guide_lines = [line for line in f.read().splitlines() if line.strip()]
+
+    nlp = load_spacy()
+    if args.build:
+        wv = KeyedVectors.load('word2vec_vectors_improved.kv', mmap='r')
+        table = build_lemma_table(kb_texts + guide_lines, nlp, extra_words=wv.index_to_key)
+        save_lemma_table(table)
+        print(f"Tabela de lemas com {len(table)} formas salva em {LEMMA_TABLE_FILE}")
+    if args.compare:
+        fast = FastPreprocessor(load_lemma_table(), stopwords, nlp_loader=lambda: nlp)
+        queries = [item['topic'] for item in kb] + [kw for item in kb for kw in item.get('keywords', [])] + kb_texts
+        print(json.dumps(agreement_stats(queries, fast, lambda texts: spacy_preprocess_batch(nlp, texts, stopwords)), indent=2))
@@ -0,0 +1,183 @@
+# mlp_numpy.py - Inferência do MLP em NumPy puro a partir de arrays exportados (.npz)
+# O StandardScaler é dobrado na primeira camada já na exportação e o forward vira algumas
+# matmuls, sem a validação de entrada do sklearn e sem pickle no caminho de serving. Como o
+# .npz guarda os pesos finais, a carga só mapeia o arquivo: nenhuma cópia por worker.
+# No .npz quantizado os pesos int8 também ficam mapeados; a escala de cada unidade de
+# saída é aplicada depois da matmul: (h @ W_q) * scale == h @ (W_q * scale).
+import zipfile
+
+import numpy as np
+
+ACTIVATIONS = {
+    'identity': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'tanh': lambda x: np.tanh(x, out=x),
+    'logistic': lambda x: 1.0 / (1.0 + np.exp(-x)),
+}
+
+def fold_scaler(W0, b0, mean, scale):
+    # (x - mean) / scale @ W0 + b0  ==  x @ (W0 / scale) + (b0 - (mean / scale) @ W0)
+    W0 = np.asarray(W0)
+    return W0 / np.asarray(scale)[:, None], np.asarray(b0) - (np.asarray(mean) / np.asarray(scale)) @ W0
+
+def export_mlp(path, mlp, le, scaler):
+    """
+    Salva um MLPClassifier treinado (com LabelEncoder e StandardScaler) como
+    arrays simples em um .npz sem compressão, com o scaler já dobrado na primeira
+    camada, para que possa ser mapeado em memória sem nenhuma conta na carga.
+    """
+    NumpyMLP.from_sklearn(mlp, le, scaler).save(path)
+
+def quantize_int8(W):
+    """
+    Quantização simétrica int8 com uma escala por unidade de saída (cada coluna de W,
+    ou seja, cada linha de W^T): W ~= q * scale, com |q| <= 127.
+    """
+    W = np.asarray(W, dtype=np.float64)
+    scale = np.abs(W).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.rint(W / scale), -127, 127).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+def export_quantized_mlp(path, model):
+    """
+    Salva um NumpyMLP (scaler já dobrado) com pesos int8 + escalas e biases float32:
+    ~1/8 do tamanho dos pesos float64 em disco e na memória.
+    """
+    model.quantized().save(path)
+
+def _load_npz(path, mmap):
+    # np.load não mapeia membros de .npz; como o arquivo é gravado sem compressão,
+    # cada .npy interno é contíguo e pode ser aberto com np.memmap no offset certo
+    if not mmap:
+        with np.load(path, allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+        for info in zf.infolist():
+            name = info.filename[:-len('.npy')]
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: membro comprimido não pode ser mapeado ({name})")
+            # cabeçalho local do zip: 30 bytes fixos + nome + campo extra
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = np.frombuffer(f.read(4), dtype='<u2')
+            f.seek(info.header_offset + 30 + int(name_len) + int(extra_len))
+            version = np.lib.format.read_magic(f)
+            read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                           else np.lib.format.read_array_header_2_0)
+            shape, fortran_order, dtype = read_header(f)
+            if dtype.hasobject:
+                raise ValueError(f"{path}: array de objetos não suportado ({name})")
+            if shape == () or 0 in shape:
+                # escalares (ex.: nome da ativação) e vazios são lidos direto
+                count = int(np.prod(shape))
+                arrays[name] = np.frombuffer(f.read(dtype.itemsize * count), dtype=dtype).reshape(shape)
+                continue
+            arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                     order='F' if fortran_order else 'C')
+    return arrays
+
+class NumpyMLP:
+    def __init__(self, weights, biases, classes, scaler_mean=None, scaler_scale=None,
+                 activation='relu', out_activation='softmax', scales=None):
+        """
+        scales: uma escala por unidade de saída de cada camada quando os pesos são int8
+        (ver quantize_int8); None para pesos float.
+        """
+        weights = list(weights)
+        biases = list(biases)
+        if scaler_mean is not None:
+            # .npz antigos (scaler separado) ou modelo vindo do sklearn: dobra aqui, numa cópia de W0
+            weights[0], biases[0] = fold_scaler(weights[0], biases[0], scaler_mean, scaler_scale)
+        self.weights = weights
+        self.biases = biases
+        self.scales = list(scales) if scales is not None else [None] * len(weights)
+        self.classes = np.asarray(classes)
+        self.activation_name = activation
+        self.activation = ACTIVATIONS[activation]
+        self.out_activation = out_activation
+        self.n_features = np.asarray(weights[0]).shape[0]
+        # o forward roda no tipo dos pesos: float64 no modelo exportado, float32 no quantizado
+        self.dtype = np.float32 if scales is not None else np.asarray(weights[0]).dtype
+
+    @classmethod
+    def from_sklearn(cls, mlp, le, scaler):
+        # mesmo modelo que export_mlp + load, sem passar pelo disco
+        return cls(mlp.coefs_, mlp.intercepts_, le.inverse_transform(mlp.classes_), scaler.mean_, scaler.scale_,
+                   activation=mlp.activation, out_activation=mlp.out_activation_)
+
+    def quantized(self):
+        # mesmo modelo que export_quantized_mlp + load, sem passar pelo disco
+        weights, scales = zip(*(quantize_int8(W) for W in self.weights))
+        return NumpyMLP(weights, [np.asarray(b, dtype=np.float32) for b in self.biases], self.classes,
+                        activation=self.activation_name, out_activation=self.out_activation, scales=scales)
+
+    def save(self, path):
+        # classes já traduzidas para os IDs originais do knowledge base; pesos com o scaler dobrado
+        arrays = {
+            'classes': np.asarray(self.classes),
+            'activation': np.array(self.activation_name),
+            'out_activation': np.array(self.out_activation),
+        }
+        quantized = self.scales[0] is not None
+        if quantized:
+            arrays['quantization'] = np.array('int8')
+        for i, (W, b, scale) in enumerate(zip(self.weights, self.biases, self.scales)):
+            if quantized:
+                arrays[f'W{i}_q'], arrays[f'W{i}_scale'] = np.asarray(W), np.asarray(scale)
+            else:
+                arrays[f'W{i}'] = np.asarray(W)
+            arrays[f'b{i}'] = np.asarray(b)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        data = _load_npz(path, mmap)
+        n_layers = sum(1 for name in data if name.startswith('b'))
+        if 'quantization' in data:
+            # pesos int8 seguem mapeados (sem cópia float32 por worker); escalas e biases são pequenos
+            return cls(
+                weights=[data[f'W{i}_q'] for i in range(n_layers)],
+                biases=[np.asarray(data[f'b{i}']) for i in range(n_layers)],
+                classes=data['classes'],
+                activation=str(data['activation']),
+                out_activation=str(data['out_activation']),
+                scales=[np.asarray(data[f'W{i}_scale']) for i in range(n_layers)],
+            )
+        return cls(
+            weights=[data[f'W{i}'] for i in range(n_layers)],
+            biases=[data[f'b{i}'] for i in range(n_layers)],
+            classes=data['classes'],
+            scaler_mean=data.get('scaler_mean'),
+            scaler_scale=data.get('scaler_scale'),
+            activation=str(data['activation']),
+            out_activation=str(data['out_activation']),
+        )
+
+    def predict_proba(self, X):
+        """
+        X: matriz (n_amostras x n_features) de embeddings ainda não normalizados.
+        """
+        h = np.asarray(X, dtype=self.dtype)
+        last = len(self.weights) - 1
+        for i, (W, b, scale) in enumerate(zip(self.weights, self.biases, self.scales)):
+            h = h @ W
+            if scale is not None:
+                h *= scale
+            h += b
+            if i < last:
+                h = self.activation(h)
+
+        if self.out_activation == 'softmax':
+            h -= h.max(axis=1, keepdims=True)
+            np.exp(h, out=h)
+            h /= h.sum(axis=1, keepdims=True)
+            return h
+        if self.out_activation == 'logistic':
+            p = ACTIVATIONS['logistic'](h)
+            return np.hstack([1 - p, p]) if p.shape[1] == 1 else p
+        return h
+
+    def predict(self, X):
+        return self.classes[self.predict_proba(X).argmax(axis=1)]
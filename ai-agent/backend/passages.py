@@ -0,0 +1,154 @@
+# passages.py - Índice de trechos (passagens) dos guias em texto (ex.: guia_cuidador.txt)
+# O guia é lido em streaming, linha a linha, e cortado em janelas de palavras com
+# sobreposição dentro de cada módulo; cada trecho guarda os offsets no arquivo e o
+# módulo/seção de origem. Os trechos são indexados no BM25 à medida que são gerados e
+# gravados em JSON Lines; em memória ficam só as postings e o offset de cada linha, e o
+# texto é lido do arquivo apenas para os trechos devolvidos por uma busca.
+import json
+import os
+import re
+import tempfile
+from array import array
+from collections import deque
+from itertools import chain
+
+from bm25 import BM25
+
+GUIDE_FILE = 'guia_cuidador.txt'
+PASSAGE_WORDS = 120   # palavras por trecho
+PASSAGE_OVERLAP = 40  # palavras repetidas entre trechos vizinhos
+
+# "Módulo 5: Cuidados com o corpo 22" (o número final é a página, no sumário)
+MODULE_RE = re.compile(r'^\s*Módulo\s+(\d+)\s*:\s*(.*?)(?:\s+\d+)?\s*$')
+# entrada de sumário: título curto seguido do número da página ("Engasgo 44")
+TOC_LINE_RE = re.compile(r'^\D{1,80}\s\d{1,3}\s*$')
+WORD_RE = re.compile(r'\S+')
+
+def iter_lines(path):
+    # (offset em caracteres, linha) sem carregar o arquivo inteiro; newline='' mantém os offsets exatos
+    offset = 0
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for line in f:
+            yield offset, line
+            offset += len(line)
+
+def iter_words(lines):
+    """
+    (módulo, seção, início, fim, palavra) para cada palavra do guia; as linhas de
+    cabeçalho "Módulo N: ..." mudam o módulo corrente e, como as entradas do
+    sumário, não entram nos trechos.
+    """
+    module = section = None
+    for offset, line in lines:
+        header = MODULE_RE.match(line)
+        if header:
+            module, section = f"Módulo {header.group(1)}", header.group(2)
+            continue
+        if TOC_LINE_RE.match(line):
+            continue
+        for m in WORD_RE.finditer(line):
+            yield module, section, offset + m.start(), offset + m.end(), m.group()
+
+def iter_passages(path, size=PASSAGE_WORDS, overlap=PASSAGE_OVERLAP, source=None):
+    """
+    Gera os trechos de um guia com memória limitada a uma janela de `size` palavras.
+    Os trechos não atravessam a fronteira entre módulos.
+    """
+    if not 0 <= overlap < size:
+        raise ValueError("é preciso 0 <= overlap < size")
+    source = source or os.path.basename(path)
+    window = deque()
+    fresh = 0  # palavras da janela que ainda não saíram em nenhum trecho
+    current = None
+
+    def emit():
+        (module, section), start, end = current, window[0][0], window[-1][1]
+        return {
+            'id': f"{source}:{start}",
+            'source': source,
+            'module': module,
+            'section': section,
+            'start': start,
+            'end': end,
+            'text': ' '.join(w for _, _, w in window),
+        }
+
+    for module, section, start, end, word in iter_words(iter_lines(path)):
+        if (module, section) != current:
+            if fresh:
+                yield emit()
+            window.clear()
+            fresh = 0
+            current = (module, section)
+        window.append((start, end, word))
+        fresh += 1
+        if len(window) == size:
+            yield emit()
+            for _ in range(size - overlap):
+                window.popleft()
+            fresh = 0
+    if fresh:
+        yield emit()
+
+class PassageIndex:
+    def __init__(self, file, offsets, bm25):
+        """
+        file: arquivo binário aberto com os trechos em JSON Lines (id, source, module, section,
+              start, end, text), na ordem do BM25
+        offsets: offset em bytes do início de cada linha, mais o tamanho do arquivo no fim
+        """
+        self.file = file
+        self.offsets = offsets
+        self.bm25 = bm25
+
+    @classmethod
+    def build(cls, paths=(GUIDE_FILE,), size=PASSAGE_WORDS, overlap=PASSAGE_OVERLAP, bm25_backend='python'):
+        # pipeline de geradores: arquivo -> palavras -> janelas -> (JSON Lines, BM25), sem listas
+        # intermediárias; o arquivo é temporário até o save do bundle copiá-lo
+        file = tempfile.TemporaryFile()
+        offsets = array('q', [0])
+
+        def texts():
+            for passage in chain.from_iterable(iter_passages(p, size, overlap) for p in paths):
+                line = json.dumps(passage, ensure_ascii=False).encode('utf-8') + b'\n'
+                file.write(line)
+                offsets.append(offsets[-1] + len(line))
+                yield passage['text']
+
+        bm25 = BM25(texts(), backend=bm25_backend, updatable=False)
+        file.flush()
+        return cls(file, offsets, bm25)
+
+    @classmethod
+    def load(cls, path, bm25):
+        # só os offsets das linhas são lidos; os textos ficam no arquivo
+        file = open(path, 'rb')
+        offsets = array('q', [0])
+        for line in file:
+            offsets.append(offsets[-1] + len(line))
+        return cls(file, offsets, bm25)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _read(self, offset, length):
+        # pread não usa nem move a posição do arquivo: o descritor aberto antes do fork
+        # (gunicorn com preload_app) é compartilhado pelos workers e por todas as threads
+        return os.pread(self.file.fileno(), length, offset)
+
+    def passage(self, idx):
+        return json.loads(self._read(self.offsets[idx], self.offsets[idx + 1] - self.offsets[idx]))
+
+    def search(self, query, top_k=3, min_score=0.0):
+        results = []
+        for idx, score in self.bm25.get_top_n(query, top_k):
+            if score > min_score:
+                results.append(dict(self.passage(idx), score=float(score)))
+        return results
+
+    def save_passages(self, path):
+        # cópia em blocos do arquivo de trechos (JSON Lines)
+        total = self.offsets[-1]
+        with open(path, 'wb') as f:
+            for offset in range(0, total, 1 << 20):
+                f.write(self._read(offset, min(1 << 20, total - offset)))
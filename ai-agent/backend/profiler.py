@@ -0,0 +1,74 @@
+# profiler.py - Profiler por amostragem que pode ser ligado e desligado com o servidor no ar
+# Uma thread lê periodicamente a pilha de todas as outras (sys._current_frames) e conta
+# as pilhas iguais. A saída usa o formato "collapsed" (função;função;... contagem), que
+# flamegraph.pl e speedscope leem direto. Sem hooks no código medido e com custo só enquanto ligado.
+import sys
+import threading
+import time
+from collections import Counter
+
+class SamplingProfiler:
+    def __init__(self, max_depth=64):
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._stacks = Counter()
+        self.samples = 0
+        self.interval = None
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms=5.0):
+        with self._lock:
+            if self.running:
+                return False
+            self._stacks = Counter()
+            self.samples = 0
+            self.interval = interval_ms / 1000.0
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            self._stop.set()
+        if thread is not None:
+            thread.join()
+        return self.collapsed()
+
+    def _stack(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = [self._stack(frame) for ident, frame in sys._current_frames().items() if ident != me]
+            with self._lock:
+                self._stacks.update(stacks)
+                self.samples += 1
+
+    def collapsed(self, limit=None):
+        with self._lock:
+            items = self._stacks.most_common(limit)
+        return ''.join(f"{stack} {count}\n" for stack, count in items)
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000 if self.interval else None,
+            "samples": self.samples,
+            "distinct_stacks": len(self._stacks),
+            "started_at": self.started_at,
+        }
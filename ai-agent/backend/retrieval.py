@@ -0,0 +1,189 @@
+# retrieval.py - Recuperação híbrida para o fallback: cada estágio (BM25, TF-IDF, denso)
+# produz um ranking de candidatos e os rankings são fundidos por reciprocal rank
+# fusion (RRF) ou por soma ponderada de scores normalizados.
+import numpy as np
+
+FUSION_METHODS = ('rrf', 'weighted', 'bm25')
+
+def top_k_dense(scores, k):
+    # top-k de um vetor denso com argpartition (sem ordenar tudo), só scores > 0
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    idx = np.argpartition(-scores, k - 1)[:k]
+    idx = idx[scores[idx] > 0]
+    # score decrescente, empate pelo menor índice
+    idx = idx[np.lexsort((idx, -scores[idx]))]
+    return [(int(i), float(scores[i])) for i in idx]
+
+class BM25Ranker:
+    def __init__(self, bm25):
+        self.bm25 = bm25
+
+    def search(self, query, n, context=None):
+        return self.bm25.get_top_n(query, n)
+
+class TfidfRanker:
+    def __init__(self, vectorizer, X_tfidf):
+        """
+        X_tfidf: matriz documento-termo com linhas normalizadas (L2), como sai do TfidfVectorizer;
+        o cosseno vira um produto esparso direto
+        """
+        self.vectorizer = vectorizer
+        self.X_tfidf = X_tfidf.tocsr()
+
+    def search(self, query, n, context=None):
+        q_vec = self.vectorizer.transform([query])
+        sims = (self.X_tfidf @ q_vec.T).toarray().ravel()
+        return top_k_dense(sims, n)
+
+def _unit_rows(X):
+    norms = np.linalg.norm(X, axis=-1, keepdims=True)
+    return np.divide(X, norms, out=np.zeros_like(X), where=norms > 0)
+
+class DenseIndex:
+    def __init__(self, matrix, mean, ann=None):
+        """
+        matrix: embeddings dos itens já centralizados e normalizados (L2), float32
+        mean: vetor médio subtraído antes da normalização (as médias de Word2Vec
+              compartilham uma direção comum que, sem centralizar, deixa tudo com cosseno ~1)
+        ann: índice aproximado opcional (ex.: IVFIndex) que restringe os candidatos
+        """
+        self.matrix = matrix
+        self.mean = mean
+        self.ann = ann
+        if ann is not None:
+            ann.fit(matrix)
+
+    @staticmethod
+    def prepare(embeddings):
+        # (embeddings brutos) -> (matriz normalizada, média), para salvar no bundle
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        mean = embeddings.mean(axis=0) if len(embeddings) else np.zeros(embeddings.shape[1], dtype=np.float32)
+        return DenseIndex.project(embeddings, mean), mean.astype(np.float32)
+
+    @staticmethod
+    def project(embeddings, mean):
+        # centraliza com uma média já calculada e normaliza (ex.: itens novos do knowledge base)
+        return _unit_rows(np.asarray(embeddings, dtype=np.float32) - mean).astype(np.float32)
+
+    def search(self, vector, n):
+        q = _unit_rows(np.asarray(vector, dtype=np.float32) - self.mean)
+        if not q.any():
+            return []
+        if self.ann is None:
+            return top_k_dense(self.matrix @ q, n)
+        candidates = self.ann.candidates(q)
+        ranked = top_k_dense(self.matrix[candidates] @ q, n)
+        return [(int(candidates[i]), score) for i, score in ranked]
+
+class IVFIndex:
+    def __init__(self, n_lists=16, n_probe=4, n_iter=10, seed=42):
+        """
+        Índice invertido por k-means esférico: cada item cai na lista do centróide mais
+        próximo e a busca só visita as n_probe listas mais próximas da consulta.
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.seed = seed
+
+    def fit(self, matrix):
+        n_lists = max(1, min(self.n_lists, len(matrix)))
+        rng = np.random.default_rng(self.seed)
+        centroids = np.array(matrix[rng.choice(len(matrix), n_lists, replace=False)]) if len(matrix) else np.zeros((1, matrix.shape[1]), dtype=np.float32)
+        assign = np.zeros(len(matrix), dtype=np.intp)
+        for _ in range(self.n_iter if len(matrix) else 0):
+            assign = (matrix @ centroids.T).argmax(axis=1)
+            for c in range(n_lists):
+                members = matrix[assign == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = _unit_rows(centroids)
+        self.centroids = centroids
+        self.lists = [np.flatnonzero(assign == c) for c in range(len(centroids))]
+
+    def candidates(self, q):
+        sims = self.centroids @ q
+        probe = np.argpartition(-sims, min(self.n_probe, len(sims)) - 1)[:self.n_probe]
+        return np.concatenate([self.lists[c] for c in probe])
+
+class DenseRanker:
+    def __init__(self, index, embed_query):
+        """
+        embed_query: função texto -> embedding médio, usada quando o embedding da
+                     pergunta não vem pronto do MLP no contexto
+        """
+        self.index = index
+        self.embed_query = embed_query
+
+    def search(self, query, n, context=None):
+        vector = context.get('embedding') if context else None
+        if vector is None:
+            vector = self.embed_query(query)
+        return self.index.search(vector, n)
+
+class HybridRetriever:
+    def __init__(self, rankers, method='rrf', rrf_k=60, candidates=20, min_scores=None):
+        """
+        rankers: dict nome -> (ranker, peso); o primeiro é o estágio principal
+        method: 'rrf', 'weighted' (min-max por ranking) ou 'bm25' (só o estágio principal)
+        rrf_k: constante do RRF (1 / (rrf_k + posição))
+        candidates: quantos candidatos cada estágio contribui para a fusão
+        min_scores: dict nome -> limiar de score bruto; um documento é relevante se
+                    superar o limiar em pelo menos um estágio
+        """
+        if method not in FUSION_METHODS:
+            raise ValueError(f"método de fusão inválido: {method}")
+        self.rankers = rankers
+        self.method = method
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.min_scores = min_scores or {}
+
+    def _fuse(self, rankings):
+        fused = {}
+        for name, ranked in rankings.items():
+            weight = self.rankers[name][1]
+            if not ranked:
+                continue
+            if self.method == 'rrf':
+                for rank, (idx, _) in enumerate(ranked, start=1):
+                    fused[idx] = fused.get(idx, 0.0) + weight / (self.rrf_k + rank)
+            else:
+                scores = [s for _, s in ranked]
+                lo, hi = min(scores), max(scores)
+                span = hi - lo
+                for idx, s in ranked:
+                    norm = (s - lo) / span if span > 0 else 1.0
+                    fused[idx] = fused.get(idx, 0.0) + weight * norm
+        return fused
+
+    def search(self, query, top_k=3, context=None):
+        """
+        Retorna até top_k dicts {'index', 'score', 'scores': {estágio: score bruto}},
+        em ordem decrescente do score fundido, só com documentos relevantes.
+        context: dados já calculados da pergunta (ex.: {'embedding': ...}) repassados aos estágios
+        """
+        names = list(self.rankers)
+        if self.method == 'bm25':
+            names = names[:1]
+        rankings = {name: self.rankers[name][0].search(query, max(self.candidates, top_k), context) for name in names}
+
+        raw = {}
+        for name, ranked in rankings.items():
+            for idx, score in ranked:
+                raw.setdefault(idx, {})[name] = score
+
+        if self.method == 'bm25':
+            fused = {idx: scores[names[0]] for idx, scores in raw.items()}
+        else:
+            fused = self._fuse(rankings)
+
+        def relevant(scores):
+            if not self.min_scores:
+                return True
+            return any(scores.get(name, 0.0) > minimum for name, minimum in self.min_scores.items())
+
+        ranked = sorted((idx for idx in fused if relevant(raw[idx])), key=lambda i: (-fused[i], i))
+        return [{'index': idx, 'score': fused[idx], 'scores': raw[idx]} for idx in ranked[:top_k]]
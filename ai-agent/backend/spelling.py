@@ -0,0 +1,175 @@
+# spelling.py - Correção de erros de digitação antes do embedding e do BM25 (estilo SymSpell)
+# O dicionário (termos do knowledge base, do guia e do vocabulário do Word2Vec, com a
+# frequência no corpus) é indexado pelas suas deleções de até max_distance letras.
+# Uma palavra desconhecida gera as próprias deleções e só os termos que compartilham
+# alguma delas são comparados por distância de edição: o custo por palavra não depende
+# do tamanho do vocabulário. As comparações ignoram acentos ("alimentacao" -> "alimentação").
+# Na dúvida, a palavra fica como está: uma palavra certa fora do dicionário ("tosse",
+# "vacina") trocada por outra ("fosse", "acima") é pior que um erro de digitação mantido.
+import re
+import threading
+import unicodedata
+from itertools import combinations
+
+MAX_EDIT_DISTANCE = 2
+PREFIX_LENGTH = 7  # deleções calculadas só sobre o prefixo (índice menor, mesmos candidatos)
+MIN_WORD_LENGTH = 5  # palavras mais curtas não são corrigidas (vizinhas demais de outras palavras)
+MIN_LENGTH_DISTANCE_2 = 9  # abaixo disso, só 1 edição
+MIN_CANDIDATE_FREQUENCY = 5  # o termo escolhido precisa aparecer ao menos isso no corpus
+FREQUENCY_RATIO = 5.0  # e ser esse tanto mais frequente que outro candidato à mesma distância
+MAX_WORDS_PER_TEXT = 32  # palavras verificadas por pergunta (o resto fica como está)
+MAX_CACHED_WORDS = 50000
+
+WORD_RE = re.compile(r"[^\W\d_]+")
+
+def strip_accents(word):
+    return ''.join(ch for ch in unicodedata.normalize('NFKD', word) if not unicodedata.combining(ch))
+
+def term_frequencies(bm25):
+    # frequência de cada termo no corpus indexado (soma dos tf das postings)
+    return {term: sum(tf for _, tf in postings) for term, postings in bm25.postings.items()}
+
+def _deletes(word, max_distance):
+    # todas as strings obtidas removendo até max_distance letras (inclui a própria palavra)
+    result = {word}
+    for d in range(1, min(max_distance, len(word) - 1) + 1):
+        for positions in combinations(range(len(word)), d):
+            result.add(''.join(ch for i, ch in enumerate(word) if i not in positions))
+    return result
+
+def edit_distance(a, b, max_distance):
+    # Damerau-Levenshtein restrita (transposição de letras vizinhas conta 1); > max_distance vira max_distance + 1
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        row = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], prev2[j - 2] + 1)
+        if min(row) > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, row
+    return prev[-1]
+
+class SpellCorrector:
+    def __init__(self, frequencies, stopwords=(), max_distance=MAX_EDIT_DISTANCE, prefix_length=PREFIX_LENGTH,
+                 min_length=MIN_WORD_LENGTH):
+        """
+        frequencies: dict palavra -> frequência no corpus (desempata candidatos à mesma distância)
+        stopwords: nunca corrigidas
+        Todos os termos de frequencies contam como conhecidos; só os com frequência
+        >= MIN_CANDIDATE_FREQUENCY podem ser escolhidos como correção.
+        """
+        self.known = set(frequencies)
+        self.stopwords = set(stopwords)
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.min_length = min_length
+
+        # chave sem acento -> (palavra, frequência) mais frequente com essa chave
+        self.words = {}
+        for word, freq in frequencies.items():
+            if WORD_RE.fullmatch(word):
+                key = strip_accents(word)
+                if key not in self.words or freq > self.words[key][1]:
+                    self.words[key] = (word, freq)
+
+        self.deletes = {}
+        for key in self.words:
+            for d in _deletes(key[:prefix_length], max_distance):
+                self.deletes.setdefault(d, []).append(key)
+
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.corrected = 0
+
+    def lookup(self, word):
+        """
+        Termo do dicionário mais próximo de word (minúscula), ou None se nenhum estiver perto
+        o bastante ou se a escolha não for clara (candidatos à mesma distância com frequências
+        parecidas, ou um candidato raro demais no corpus).
+        """
+        key = strip_accents(word)
+        if key in self.words:
+            return self.words[key][0]
+        if len(key) < self.min_length:
+            return None
+        max_distance = 1 if len(key) < MIN_LENGTH_DISTANCE_2 else self.max_distance
+        candidates = set()
+        for d in _deletes(key[:self.prefix_length], max_distance):
+            candidates.update(self.deletes.get(d, ()))
+
+        ranked = []
+        for candidate in candidates:
+            distance = edit_distance(key, candidate, max_distance)
+            if distance <= max_distance:
+                ranked.append((distance, -self.words[candidate][1], candidate))
+        if not ranked:
+            return None
+        ranked.sort()
+        distance, best_freq, best = ranked[0]
+        if -best_freq < MIN_CANDIDATE_FREQUENCY:
+            return None
+        # singular e plural do mesmo termo ("quedas"/"queda") não disputam entre si
+        rivals = [freq for d, freq, candidate in ranked[1:]
+                  if d == distance and candidate.rstrip('s') != best.rstrip('s')]
+        if rivals and -best_freq < FREQUENCY_RATIO * -rivals[0]:
+            return None
+        return self.words[best][0]
+
+    def correct_word(self, word, known=None):
+        """
+        known: função palavra -> bool com termos aceitos além do dicionário
+               (ex.: termos de itens criados pela API /kb/items depois da inicialização)
+        """
+        if word in self.known or word in self.stopwords or (known is not None and known(word)):
+            return word
+        correction = self._cache.get(word)
+        if correction is None:
+            correction = self.lookup(word) or word
+            with self._lock:
+                if len(self._cache) < MAX_CACHED_WORDS:
+                    self._cache[word] = correction
+        return correction
+
+    def needs_lookup(self, text, known=None):
+        """
+        True se alguma palavra de text teria de passar por lookup (ou pelo cache); só consultas a
+        conjuntos, para decidir no event loop se a correção precisa ir para o pool de inferência.
+        """
+        for match in WORD_RE.finditer(text):
+            word = match.group().lower()
+            if len(word) >= self.min_length and word not in self.known and word not in self.stopwords \
+                    and (known is None or not known(word)):
+                return True
+        return False
+
+    def correct(self, text, known=None):
+        # troca só as palavras corrigidas; pontuação, números e o resto do texto ficam como estão
+        checked = corrected = 0
+
+        def replace(match):
+            nonlocal checked, corrected
+            word = match.group().lower()
+            if checked >= MAX_WORDS_PER_TEXT:
+                return match.group()
+            checked += 1
+            correction = self.correct_word(word, known)
+            if correction == word:
+                return match.group()
+            corrected += 1
+            return correction
+
+        result = WORD_RE.sub(replace, text)
+        with self._lock:
+            self.checked += checked
+            self.corrected += corrected
+        return result
+
+    def stats(self):
+        return {"words": len(self.words), "deletes": len(self.deletes), "cached": len(self._cache),
+                "checked": self.checked, "corrected": self.corrected}
@@ -0,0 +1,134 @@
+# suggest.py - Autocompletar do /suggest: trie de prefixos com o top-k pré-calculado em cada nó
+# Entradas: tópicos e keywords do knowledge base (indexados a partir de cada palavra, para
+# "diab" achar "diabetes mellitus") e perguntas frequentes já respondidas com confiança.
+# Uma consulta só desce pelos caracteres do prefixo e devolve a lista pronta do nó.
+import threading
+
+from keyword_router import normalize
+
+SUGGEST_TOP_K = 8
+MAX_PREFIX_CHARS = 24  # profundidade máxima da trie; prefixos maiores filtram a lista do último nó
+MAX_QUERIES = 2000  # perguntas distintas acompanhadas (as mais novas além disso são ignoradas)
+MIN_QUERY_COUNT = 3  # vezes que uma pergunta precisa aparecer para virar sugestão
+MAX_QUERY_CHARS = 80
+
+# pesos das entradas fixas; cada vez que uma pergunta é feita ela ganha 1
+WEIGHTS = {'topic': 5, 'keyword': 3, 'query': 0}
+
+class _Node:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.top = ()  # tupla (score, chave) ordenada; trocada inteira, nunca alterada no lugar
+
+class Suggester:
+    def __init__(self, top_k=SUGGEST_TOP_K, max_queries=MAX_QUERIES, min_query_count=MIN_QUERY_COUNT):
+        self.top_k = top_k
+        self.max_queries = max_queries
+        self.min_query_count = min_query_count
+        self._lock = threading.Lock()
+        self.entries = {}  # chave normalizada -> {"text", "kind", "score"}
+        self.query_counts = {}
+        self.query_texts = {}  # chave -> texto da primeira vez que a pergunta apareceu
+        self.root = _Node()
+        self.kb_version = None
+
+    def load_kb(self, knowledge_base, version=None):
+        # remonta a trie com os tópicos/keywords atuais; as perguntas acompanhadas continuam
+        entries = {}
+        for item in knowledge_base:
+            if item.get('module') == 'Conversação':  # saudação/despedida não são sugestões úteis
+                continue
+            for kind, text in [('topic', item['topic'])] + [('keyword', kw) for kw in item.get('keywords') or []]:
+                key = normalize(text)
+                if key and (key not in entries or WEIGHTS[kind] > entries[key]['score']):
+                    entries[key] = {"text": text, "kind": kind, "score": WEIGHTS[kind]}
+        with self._lock:
+            counts = dict(self.query_counts)
+        for key, count in counts.items():
+            if key in entries:
+                entries[key]['score'] += count
+            elif count >= self.min_query_count:
+                entries[key] = {"text": self.query_texts[key], "kind": 'query', "score": count}
+
+        root = _Node()
+        for key, entry in entries.items():
+            self._insert(root, entries, key, entry['score'])
+        with self._lock:
+            self.entries = entries
+            self.root = root
+            self.kb_version = version
+
+    def _paths(self, key, kind):
+        # tópicos e keywords: a partir de cada palavra; perguntas: só do começo
+        starts = [0] if kind == 'query' else [0] + [i + 1 for i, ch in enumerate(key) if ch == ' ']
+        return [key[start:start + MAX_PREFIX_CHARS] for start in starts]
+
+    def _insert(self, root, entries, key, score):
+        # os scores só crescem: basta reavaliar os nós do caminho da chave
+        for path in self._paths(key, entries[key]['kind']):
+            node = root
+            self._offer(node, entries, key, score)
+            for ch in path:
+                child = node.children.get(ch)
+                if child is None:
+                    child = node.children[ch] = _Node()
+                node = child
+                self._offer(node, entries, key, score)
+
+    def _offer(self, node, entries, key, score):
+        top = [(s, k) for s, k in node.top if k != key]
+        top.append((score, key))
+        top.sort(key=lambda sk: (-sk[0], sk[1]))
+        node.top = tuple(top[:self.top_k])
+
+    def record(self, question):
+        """Conta uma pergunta respondida com confiança; a partir de min_query_count ela vira sugestão."""
+        key = normalize(question)
+        if not key or len(question) > MAX_QUERY_CHARS:
+            return
+        with self._lock:
+            count = self.query_counts.get(key)
+            if count is None:
+                if len(self.query_counts) >= self.max_queries:
+                    return
+                count = 0
+                self.query_texts[key] = question.strip()
+            count = self.query_counts[key] = count + 1
+            entry = self.entries.get(key)
+            if entry is None:
+                if count < self.min_query_count:
+                    return
+                entry = self.entries[key] = {"text": self.query_texts[key], "kind": 'query', "score": count}
+            else:
+                entry['score'] += 1
+            self._insert(self.root, self.entries, key, entry['score'])
+
+    def suggest(self, prefix, k=None):
+        k = min(k or self.top_k, self.top_k)
+        key = normalize(prefix)
+        root = self.root
+        entries = self.entries
+        # "o que é diab": se nada começa com a frase inteira, tenta a partir das palavras seguintes
+        starts = [0] + [i + 1 for i, ch in enumerate(key) if ch == ' ']
+        for start in starts:
+            sub = key[start:]
+            node = root
+            for ch in sub[:MAX_PREFIX_CHARS]:
+                node = node.children.get(ch)
+                if node is None:
+                    break
+            if node is None:
+                continue
+            found = [entry_key for _, entry_key in node.top]
+            if len(sub) > MAX_PREFIX_CHARS:
+                found = [entry_key for entry_key in found if sub in entry_key]
+            if found:
+                return [{"text": entries[entry_key]['text'], "kind": entries[entry_key]['kind']} for entry_key in found[:k]]
+        return []
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self.entries), "tracked_queries": len(self.query_counts),
+                    "suggested_queries": sum(1 for e in self.entries.values() if e['kind'] == 'query')}
@@ -0,0 +1,231 @@
+# sweep.py - Varredura de hiperparâmetros e limiares do pipeline MLP + fallback
+# Treina uma grade de configurações (Word2Vec x camadas do MLP) num pool de processos,
+# reaproveitando as etapas em cache do treino (chatbot_ml.py / train_cache.py), e avalia
+# cada uma com todas as combinações de limiares (confiança do MLP, mínimos de BM25/TF-IDF)
+# sobre as perguntas de teste, com e sem ruído. Grava a melhor em tuning.json, lido pelo
+# backend na inicialização e pelo próximo `chatbot_ml.py --train`.
+#
+# Uso: python sweep.py [--w2v-size 50 100] [--hidden 200,100 100] [--workers 4] [--apply]
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from benchmark import BENCH_SEED, add_noise
+from chatbot_ml import (KNOWLEDGE_BASE, bm25, vectorizer, X_tfidf, corpus_stage, word2vec_stage, synthetic_stage,
+                        features_stage, mlp_stage, preprocess_texts, split_indices)
+from embeddings import SentenceEmbedder
+from mlp_numpy import NumpyMLP
+from retrieval import HybridRetriever, BM25Ranker, TfidfRanker
+from train_cache import StageCache
+from tuning import load_tuning, save_tuning, TUNING_FILE
+
+CONFIDENCE_GRID = (0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+MIN_BM25_GRID = (0.5, 1.0, 2.0, 3.0)
+MIN_TFIDF_GRID = (0.2, 0.3, 0.4)
+SWEEP_REPORT_FILE = 'sweep_report.json'
+
+class _MemoRanker:
+    # guarda o ranking de cada pergunta: as combinações de limiares refazem só a fusão e o filtro
+    def __init__(self, ranker):
+        self.ranker = ranker
+        self._memo = {}
+
+    def search(self, query, n, context=None):
+        key = (query, n)
+        if key not in self._memo:
+            self._memo[key] = self.ranker.search(query, n, context)
+        return self._memo[key]
+
+def fallback_predictions(questions, gates):
+    """
+    Id do item que o fallback (BM25 + TF-IDF por RRF) devolve em primeiro lugar para cada
+    pergunta, em cada combinação (min_bm25, min_tfidf); None quando nada passa do limiar.
+    Retorna também a latência média de uma busca (ms).
+    """
+    rankers = {'bm25': (_MemoRanker(BM25Ranker(bm25)), 1.0), 'tfidf': (_MemoRanker(TfidfRanker(vectorizer, X_tfidf)), 1.0)}
+    seconds = []
+    for question in questions:
+        start = time.perf_counter()
+        HybridRetriever(rankers, method='rrf').search(question, 1)
+        seconds.append(time.perf_counter() - start)
+    predictions = {}
+    for min_bm25, min_tfidf in gates:
+        retriever = HybridRetriever(rankers, method='rrf', min_scores={'bm25': min_bm25, 'tfidf': min_tfidf})
+        predictions[(min_bm25, min_tfidf)] = [
+            KNOWLEDGE_BASE[hits[0]['index']]['id'] if hits else None
+            for hits in (retriever.search(question, 1) for question in questions)
+        ]
+    return predictions, float(np.mean(seconds) * 1000)
+
+def evaluation_set(cache, synthetic, seed):
+    # perguntas de teste (fora do treino do MLP) + uma cópia de cada com ruído de paráfrase
+    _, data, labels = synthetic
+    _, test_idx = split_indices(labels)
+    rng = random.Random(seed)
+    clean = [data[i] for i in test_idx]
+    questions = clean + [add_noise(text, rng) for text in clean]
+    eval_labels = [labels[i] for i in test_idx] * 2
+    tokens = preprocess_texts(questions, cache, memo_name='tokens_eval')
+    return questions, tokens, eval_labels
+
+# Estado compartilhado pelos processos do pool (definido uma vez por processo no initializer)
+_EVAL = {}
+
+def _init_worker(shared):
+    _EVAL.update(shared)
+
+def prepare_embeddings(w2v_params):
+    # fase 1: Word2Vec e features de cada combinação do Word2Vec (uma tarefa por combinação)
+    # (sem poda durante o sweep: cada configuração fica no cache até a fase 2 e o --apply)
+    cache = StageCache(keep=None)
+    w2v = word2vec_stage(cache, corpus_stage(cache), *w2v_params)
+    features_stage(cache, synthetic_stage(cache), w2v)
+    return w2v_params, dict(cache.report)
+
+def evaluate_config(w2v_params, hidden_layers):
+    # fase 2: MLP de uma configuração e todas as combinações de limiares sobre ele
+    cache = StageCache(keep=None)
+    w2v = word2vec_stage(cache, corpus_stage(cache), *w2v_params)
+    synthetic = synthetic_stage(cache)
+    features_key, X, _ = features_stage(cache, synthetic, w2v)
+    _, (mlp, le, scaler), _ = mlp_stage(cache, features_key, X, synthetic[2], hidden_layers)
+
+    model = NumpyMLP.from_sklearn(mlp, le, scaler)
+    E = SentenceEmbedder(w2v[1].wv).embed_batch(_EVAL['tokens'])
+    # latência do forward de uma pergunta por vez (como um /query sem micro-lote)
+    model.predict_proba(E[:1])
+    seconds = []
+    for row in E:
+        start = time.perf_counter()
+        model.predict_proba(row[None, :])
+        seconds.append(time.perf_counter() - start)
+    mlp_ms = float(np.mean(seconds) * 1000)
+
+    probs = model.predict_proba(E)
+    best = probs.argmax(axis=1)
+    confidence = probs[np.arange(len(best)), best]
+    y = np.asarray(_EVAL['labels'])
+    mlp_correct = model.classes[best] == y
+    n_clean = len(y) // 2
+
+    rows = []
+    for gate, predicted in _EVAL['fallback'].items():
+        answered = np.array([p is not None for p in predicted])
+        fallback_correct = np.array([p == label for p, label in zip(predicted, y)])
+        for threshold in _EVAL['confidence_grid']:
+            routed = confidence > threshold
+            correct = np.where(routed, mlp_correct, fallback_correct)
+            to_fallback = ~routed & answered
+            routing_rate = float(routed.mean())
+            rows.append({
+                "word2vec": {"size": w2v_params[0], "window": w2v_params[1], "min_count": w2v_params[2]},
+                "mlp_hidden_layers": list(hidden_layers),
+                "confidence_threshold": threshold,
+                "fallback_min_bm25": gate[0],
+                "fallback_min_tfidf": gate[1],
+                "accuracy": float(correct.mean()),
+                "accuracy_clean": float(correct[:n_clean].mean()),
+                "accuracy_noisy": float(correct[n_clean:].mean()),
+                "mlp_accuracy": float(mlp_correct.mean()),
+                "routing_rate": routing_rate,
+                "routing_precision": float(mlp_correct[routed].mean()) if routed.any() else None,
+                "fallback_precision": float(fallback_correct[to_fallback].mean()) if to_fallback.any() else None,
+                "no_answer_rate": float((~routed & ~answered).mean()),
+                "mlp_ms": round(mlp_ms, 4),
+                # custo esperado por pergunta: o forward sempre, a busca só quando o MLP não responde
+                "expected_ms": round(mlp_ms + (1 - routing_rate) * _EVAL['fallback_ms'], 4),
+            })
+    return rows
+
+def select_best(rows, max_latency_ms=None, min_routing_precision=None):
+    # maior acurácia dentro das restrições; empate -> menor custo esperado
+    eligible = [r for r in rows
+                if (max_latency_ms is None or r['expected_ms'] <= max_latency_ms)
+                and (min_routing_precision is None or (r['routing_precision'] or 0.0) >= min_routing_precision)]
+    if not eligible:
+        return None
+    return max(eligible, key=lambda r: (round(r['accuracy'], 6), -r['expected_ms']))
+
+def run_sweep(w2v_grid, hidden_grid, confidence_grid, gates, workers, seed=BENCH_SEED):
+    cache = StageCache(keep=None)
+    synthetic = synthetic_stage(cache)
+    # o spaCy roda uma vez aqui; nos processos do pool os tokens já vêm do memo do cache
+    preprocess_texts(synthetic[1], cache)
+    questions, tokens, labels = evaluation_set(cache, synthetic, seed)
+    fallback, fallback_ms = fallback_predictions(questions, gates)
+    shared = {"tokens": tokens, "labels": labels, "fallback": fallback, "fallback_ms": fallback_ms,
+              "confidence_grid": confidence_grid}
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(shared,)) as pool:
+        # fase 1 antes da 2: dois MLPs sobre o mesmo Word2Vec nunca o treinam em paralelo
+        list(pool.map(prepare_embeddings, w2v_grid))
+        configs = list(itertools.product(w2v_grid, hidden_grid))
+        rows = [row for result in pool.map(evaluate_config, *zip(*configs)) for row in result]
+    return rows, {"questions": len(questions), "configs": len(configs), "fallback_ms": round(fallback_ms, 4),
+                  "seconds": round(time.perf_counter() - start, 2)}
+
+# Main
+if __name__ == "__main__":
+    defaults = load_tuning(os.getenv('TUNING_FILE', TUNING_FILE))['training']
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--w2v-size', type=int, nargs='+', default=[defaults['word2vec_size']])
+    parser.add_argument('--w2v-window', type=int, nargs='+', default=[defaults['word2vec_window']])
+    parser.add_argument('--w2v-min-count', type=int, nargs='+', default=[defaults['word2vec_min_count']])
+    parser.add_argument('--hidden', nargs='+', default=['200,100', '100', '300,150'],
+                        help='Camadas ocultas do MLP, ex.: 200,100')
+    parser.add_argument('--confidence', type=float, nargs='+', default=list(CONFIDENCE_GRID))
+    parser.add_argument('--min-bm25', type=float, nargs='+', default=list(MIN_BM25_GRID))
+    parser.add_argument('--min-tfidf', type=float, nargs='+', default=list(MIN_TFIDF_GRID))
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1), help='Processos do pool')
+    parser.add_argument('--seed', type=int, default=BENCH_SEED, help='Semente do ruído nas perguntas de avaliação')
+    parser.add_argument('--max-latency-ms', type=float, help='Custo esperado máximo por pergunta (MLP + fallback)')
+    parser.add_argument('--min-routing-precision', type=float, help='Precisão mínima das respostas do MLP')
+    parser.add_argument('--out', default=os.getenv('TUNING_FILE', TUNING_FILE), help='Arquivo com a configuração vencedora')
+    parser.add_argument('--report', default=SWEEP_REPORT_FILE, help='Todas as combinações avaliadas')
+    parser.add_argument('--apply', action='store_true', help='Retreinar com a configuração vencedora (etapas em cache)')
+    args = parser.parse_args()
+
+    w2v_grid = list(itertools.product(args.w2v_size, args.w2v_window, args.w2v_min_count))
+    hidden_grid = [tuple(int(n) for n in spec.split(',')) for spec in args.hidden]
+    gates = list(itertools.product(args.min_bm25, args.min_tfidf))
+    rows, summary = run_sweep(w2v_grid, hidden_grid, args.confidence, gates, args.workers, args.seed)
+    rows.sort(key=lambda r: (-r['accuracy'], r['expected_ms']))
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump({"summary": summary, "results": rows}, f, ensure_ascii=False, indent=2)
+
+    print(f"{len(rows)} combinações ({summary['configs']} modelos) em {summary['seconds']} s; "
+          f"fallback: {summary['fallback_ms']:.3f} ms por busca")
+    for r in rows[:10]:
+        print(f"  acc {r['accuracy']:.3f} (ruído {r['accuracy_noisy']:.3f})  MLP {r['routing_rate']:.0%} "
+              f"prec {r['routing_precision'] or 0:.3f}  {r['expected_ms']:.3f} ms  w2v {r['word2vec']} "
+              f"mlp {r['mlp_hidden_layers']} conf {r['confidence_threshold']} "
+              f"bm25 {r['fallback_min_bm25']} tfidf {r['fallback_min_tfidf']}")
+
+    best = select_best(rows, args.max_latency_ms, args.min_routing_precision)
+    if best is None:
+        print("Nenhuma combinação atende às restrições; tuning.json não foi alterado")
+        sys.exit(1)
+    save_tuning({
+        "training": {"word2vec_size": best['word2vec']['size'], "word2vec_window": best['word2vec']['window'],
+                     "word2vec_min_count": best['word2vec']['min_count'], "mlp_hidden_layers": best['mlp_hidden_layers']},
+        "runtime": {"confidence_threshold": best['confidence_threshold'], "fallback_min_bm25": best['fallback_min_bm25'],
+                    "fallback_min_tfidf": best['fallback_min_tfidf']},
+        "sweep": {"created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'), **summary,
+                  **{k: best[k] for k in ('accuracy', 'accuracy_clean', 'accuracy_noisy', 'routing_rate',
+                                          'routing_precision', 'expected_ms')}},
+    }, args.out)
+    print(f"Configuração vencedora salva em {args.out}")
+    if args.apply:
+        # o treino lê o tuning.json novo; Word2Vec, features e MLP vêm do cache do sweep
+        subprocess.run([sys.executable, 'chatbot_ml.py', '--train'], check=True, env=dict(os.environ, TUNING_FILE=args.out))
+        # só agora o cache volta ao tamanho normal: as etapas da vencedora são as mais recentes
+        StageCache().prune_all()
@@ -0,0 +1,142 @@
+# train_cache.py - Cache das etapas do treinamento, endereçado pelo conteúdo
+# Cada etapa tem uma chave = hash das suas entradas (arquivos, parâmetros, código e
+# chaves das etapas anteriores). Se a chave já foi calculada, o resultado vem do disco;
+# senão a etapa roda e o resultado é gravado. Mudar só o knowledge base refaz só as
+# etapas que dependem dele.
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos (só o sweep roda etapas em paralelo)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TRAIN_CACHE_DIR = '.train_cache'
+KEEP_PER_STAGE = 2  # resultados mantidos por etapa (o atual e o anterior, para voltar atrás sem recalcular)
+
+def content_hash(*parts):
+    # partes: str, bytes ou qualquer valor serializável em JSON (ordem das chaves fixa)
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        elif not isinstance(part, bytes):
+            part = json.dumps(part, ensure_ascii=False, sort_keys=True, default=str).encode('utf-8')
+        h.update(hashlib.sha256(part).digest())
+    return h.hexdigest()
+
+class StageCache:
+    def __init__(self, root=TRAIN_CACHE_DIR, enabled=True, keep=KEEP_PER_STAGE):
+        """
+        root: diretório do cache (um subdiretório por etapa, um por chave)
+        enabled: False recalcula tudo (mas ainda grava, para a próxima execução)
+        keep: resultados mantidos por etapa; None não poda (ex.: sweep, em que processos
+              paralelos gravam mais configurações do que keep e ainda vão reler as anteriores)
+        """
+        self.root = root
+        self.enabled = enabled
+        self.keep = keep
+        self.report = {}
+
+    def path(self, stage, key):
+        return os.path.join(self.root, stage, key[:16])
+
+    def run(self, stage, key, compute, save, load):
+        """
+        compute(): calcula o resultado da etapa
+        save(result, directory) / load(directory): gravam e leem o resultado no diretório da chave
+        """
+        directory = self.path(stage, key)
+        start = time.perf_counter()
+        if self.enabled and os.path.exists(os.path.join(directory, 'stage.json')):
+            result = load(directory)
+            os.utime(directory)  # mais recente por último na poda
+            self._record(stage, key, 'cache', start)
+            return result
+
+        result = compute()
+        # grava num temporário e renomeia: uma execução interrompida nunca deixa uma etapa pela metade
+        tmp = f"{directory}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        save(result, tmp)
+        with open(os.path.join(tmp, 'stage.json'), 'w', encoding='utf-8') as f:
+            json.dump({"stage": stage, "key": key, "created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z')}, f)
+        with self._locked():
+            # outro processo pode ter gravado a mesma chave enquanto esta calculava: fica a dele
+            if os.path.exists(os.path.join(directory, 'stage.json')):
+                shutil.rmtree(tmp, ignore_errors=True)
+            else:
+                shutil.rmtree(directory, ignore_errors=True)
+                os.replace(tmp, directory)
+            self._prune(stage)
+        self._record(stage, key, 'run', start)
+        return result
+
+    def _record(self, stage, key, status, start):
+        elapsed = time.perf_counter() - start
+        self.report[stage] = {"status": status, "key": key[:16], "seconds": round(elapsed, 3)}
+        logger.info("treino: %s %s em %.2f s (%s)", stage,
+                    'reaproveitada do cache' if status == 'cache' else 'executada', elapsed, key[:16])
+
+    @contextmanager
+    def _locked(self):
+        # trava entre processos para trocar diretórios e podar (um arquivo .lock na raiz do cache)
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _prune(self, stage):
+        if self.keep is None:
+            return
+        stage_dir = os.path.join(self.root, stage)
+        entries = []
+        for name in os.listdir(stage_dir):
+            if '.tmp-' in name:
+                continue
+            try:
+                entries.append((os.path.getmtime(os.path.join(stage_dir, name)), name))
+            except FileNotFoundError:  # removida por outro processo entre o listdir e o stat
+                continue
+        entries.sort(reverse=True)
+        for _, name in entries[self.keep:]:
+            shutil.rmtree(os.path.join(stage_dir, name), ignore_errors=True)
+
+    def prune_all(self):
+        # poda todas as etapas (ex.: no fim do sweep, que roda sem poda)
+        if not os.path.isdir(self.root):
+            return
+        with self._locked():
+            for stage in os.listdir(self.root):
+                if stage != 'memo' and os.path.isdir(os.path.join(self.root, stage)):
+                    self._prune(stage)
+
+    def memo(self, name, key):
+        # tabela texto -> resultado persistida entre execuções (ex.: tokens de cada frase)
+        path = os.path.join(self.root, 'memo', f"{name}-{key[:16]}.json")
+        if not self.enabled or not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_memo(self, name, key, table):
+        directory = os.path.join(self.root, 'memo')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}-{key[:16]}.json")
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(table, f, ensure_ascii=False)
+        os.replace(tmp, path)
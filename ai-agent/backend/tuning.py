@@ -0,0 +1,42 @@
+# tuning.py - Configuração escolhida pela varredura de hiperparâmetros (sweep.py)
+# "training": parâmetros do Word2Vec e do MLP usados por `chatbot_ml.py --train`
+# "runtime": limiares lidos pelo backend na inicialização (variáveis de ambiente têm prioridade)
+import copy
+import json
+import os
+
+TUNING_FILE = 'tuning.json'
+
+DEFAULTS = {
+    "training": {
+        "word2vec_size": 100,
+        "word2vec_window": 5,
+        "word2vec_min_count": 2,
+        "mlp_hidden_layers": [200, 100],
+    },
+    "runtime": {
+        "confidence_threshold": 0.6,
+        "fallback_min_bm25": 1.0,
+        "fallback_min_tfidf": 0.3,
+    },
+}
+
+def load_tuning(path=TUNING_FILE):
+    # seções e chaves ausentes no arquivo (ou o arquivo inteiro) ficam com os padrões
+    config = copy.deepcopy(DEFAULTS)
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for section, values in data.items():
+            if isinstance(values, dict):
+                config.setdefault(section, {}).update(values)
+            else:
+                config[section] = values
+    return config
+
+def save_tuning(config, path=TUNING_FILE):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+    os.replace(tmp, path)
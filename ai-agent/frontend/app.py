@@ -2,6 +2,7 @@
 from flask import Flask, render_template, request, jsonify
 import requests
 import yaml
+from backend_client import BackendClient, BackendUnavailable
 import os
 from dotenv import load_dotenv
 import json
@@ -21,14 +22,32 @@ if os.path.exists(config_path):
 
 print(f"Usando backend URL: {backend_url}")
 
+# Cliente HTTP compartilhado: conexões reaproveitadas, timeouts, novas tentativas e circuit breaker
+backend = BackendClient(
+    backend_url,
+    connect_timeout=float(os.getenv('BACKEND_CONNECT_TIMEOUT', '2')),
+    read_timeout=float(os.getenv('BACKEND_READ_TIMEOUT', '10')),
+    max_retries=int(os.getenv('BACKEND_MAX_RETRIES', '2')),
+)
+MAX_BATCH_QUESTIONS = 256
+
+def backend_error(e):
+    if isinstance(e, BackendUnavailable):
+        headers = {'Retry-After': str(e.retry_after)} if e.retry_after else {}
+        return jsonify({'error': str(e)}), 503, headers
+    return jsonify({'error': f'Erro ao chamar API: {str(e)}'}), 500
+
 # Carregar knowledge base para sugestões
 with open('knowledge_base.json', 'r', encoding='utf-8') as f:
     KNOWLEDGE_BASE = json.load(f)
 
-# Função para obter sugestões (6 tópicos aleatórios, como no original)
+# Sugestões iniciais: as mais populares do /suggest do backend (tópicos aleatórios se ele não responder)
 def get_suggestions():
-    import random
-    return random.sample([item['topic'] for item in KNOWLEDGE_BASE], min(6, len(KNOWLEDGE_BASE)))
+    try:
+        return [s['text'] for s in backend.suggest('', k=6)['suggestions']]
+    except (BackendUnavailable, requests.exceptions.RequestException):
+        import random
+        return random.sample([item['topic'] for item in KNOWLEDGE_BASE], min(6, len(KNOWLEDGE_BASE)))
 
 # Endpoint para a página principal
 @app.route('/')
@@ -44,13 +63,33 @@ def send_message():
     if not question:
         return jsonify({'error': 'Pergunta não fornecida'}), 400
     
-    payload = {'question': question, 'top_k': 3}
     try:
-        response = requests.post(backend_url, json=payload)
-        response.raise_for_status()
-        return jsonify(response.json())
-    except requests.exceptions.RequestException as e:
-        return jsonify({'error': f'Erro ao chamar API: {str(e)}'}), 500
+        return jsonify(backend.query(question, top_k=3))
+    except (BackendUnavailable, requests.exceptions.RequestException) as e:
+        return backend_error(e)
+
+# Autocompletar: chamado pelo campo de texto a cada tecla (repassado ao /suggest do backend)
+@app.route('/suggest')
+def suggest():
+    try:
+        return jsonify(backend.suggest(request.args.get('q', ''), k=request.args.get('k', 6, type=int)))
+    except (BackendUnavailable, requests.exceptions.RequestException) as e:
+        return backend_error(e)
+
+# Endpoint para várias perguntas de uma vez (repassado ao /query_batch do backend)
+@app.route('/send_messages', methods=['POST'])
+def send_messages():
+    data = request.json or {}
+    questions = data.get('questions')
+    if not questions or not isinstance(questions, list):
+        return jsonify({'error': 'Perguntas não fornecidas'}), 400
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        return jsonify({'error': f'Máximo de {MAX_BATCH_QUESTIONS} perguntas por lote'}), 413
+
+    try:
+        return jsonify(backend.query_batch(questions, top_k=data.get('top_k', 3)))
+    except (BackendUnavailable, requests.exceptions.RequestException) as e:
+        return backend_error(e)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)), debug=True)
\ No newline at end of file
@@ -0,0 +1,146 @@
+# backend_client.py - Cliente HTTP do frontend para a API do backend
+# Uma Session compartilhada (keep-alive, pool de conexões), timeouts de conexão e leitura,
+# novas tentativas limitadas com backoff exponencial + jitter e um circuit breaker que
+# deixa de chamar o backend por um tempo depois de falhas seguidas.
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# falhas transitórias do backend (503 = sobrecarga, com Retry-After)
+RETRY_STATUSES = {502, 503}
+# prazo esgotado no backend (o mesmo timeout_ms da leitura): como o timeout de leitura, não é repetido
+DEADLINE_STATUS = 504
+
+class BackendUnavailable(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        failure_threshold: falhas seguidas que abrem o circuito
+        reset_timeout: segundos com o circuito aberto antes de deixar uma chamada de teste passar
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            # meio aberto: uma única chamada de teste por vez
+            if time.monotonic() - self._opened_at >= self.reset_timeout and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def retry_after(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            return max(1, int(self.reset_timeout - (time.monotonic() - self._opened_at)))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half-open' if self._probing else 'open'
+
+class BackendClient:
+    def __init__(self, query_url, batch_url=None, connect_timeout=2.0, read_timeout=10.0,
+                 max_retries=2, backoff=0.2, pool_size=20, breaker=None, suggest_timeout=1.0):
+        """
+        query_url: URL do /query do backend; batch_url: URL do /query_batch (derivada da anterior se None)
+        suggest_timeout: prazo de leitura do /suggest (chamado a cada tecla, sem novas tentativas)
+        max_retries: novas tentativas após a primeira, só em erro de conexão ou 502/503
+        backoff: base do backoff exponencial (s); cada espera é sorteada em [0, backoff * 2^tentativa]
+        pool_size: conexões mantidas abertas por host (uma por thread do Flask em uso simultâneo)
+        """
+        self.query_url = query_url
+        self.batch_url = batch_url or query_url.rsplit('/query', 1)[0] + '/query_batch'
+        self.suggest_url = query_url.rsplit('/query', 1)[0] + '/suggest'
+        self.timeout = (connect_timeout, read_timeout)
+        self.suggest_timeout = (connect_timeout, suggest_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        # as novas tentativas ficam a cargo de _post (com jitter e circuit breaker), não do urllib3
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _sleep_before_retry(self, attempt, response=None):
+        delay = random.uniform(0, self.backoff * (2 ** attempt))
+        if response is not None and response.headers.get('Retry-After', '').isdigit():
+            delay = max(delay, min(int(response.headers['Retry-After']), self.timeout[1]))
+        time.sleep(delay)
+
+    def _post(self, url, payload):
+        if not self.breaker.allow():
+            raise BackendUnavailable("Backend indisponível (circuito aberto)", self.breaker.retry_after())
+        # o backend recebe o mesmo prazo e descarta o trabalho que o frontend já abandonou
+        payload = dict(payload, timeout_ms=int(self.timeout[1] * 1000))
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._sleep_before_retry(attempt - 1, response)
+            response = None
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                # timeout de leitura: o backend recebeu a pergunta e está lento; repetir só piora a carga
+                if isinstance(e, requests.ReadTimeout):
+                    break
+                continue
+            if response.status_code in RETRY_STATUSES or response.status_code == DEADLINE_STATUS:
+                error = requests.HTTPError(f"{response.status_code} do backend", response=response)
+                # 504: o backend já gastou o prazo inteiro; repetir levaria outro prazo e mais carga
+                if response.status_code == DEADLINE_STATUS:
+                    break
+                continue
+            # 4xx é erro da requisição, não do backend: não conta para o circuito
+            self.breaker.record_success()
+            response.raise_for_status()
+            return response.json()
+        self.breaker.record_failure()
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        raise BackendUnavailable(f"Erro ao chamar API: {error}", int(retry_after) if retry_after and retry_after.isdigit() else None)
+
+    def query(self, question, top_k=3):
+        return self._post(self.query_url, {'question': question, 'top_k': top_k})
+
+    def query_batch(self, questions, top_k=3):
+        return self._post(self.batch_url, {'questions': questions, 'top_k': top_k})
+
+    def suggest(self, prefix, k=6):
+        # uma tentativa só e sem mexer no circuito (nem na chamada de teste): a próxima tecla já faz outra
+        if self.breaker.state != 'closed':
+            raise BackendUnavailable("Backend indisponível (circuito aberto)", self.breaker.retry_after())
+        response = self.session.get(self.suggest_url, params={'q': prefix, 'k': k}, timeout=self.suggest_timeout)
+        response.raise_for_status()
+        return response.json()